@@ -4,7 +4,8 @@ from utils import *
 from .assembly import *
 from .utils import *
 from typing import Optional, Set
-from poly import Polynomial, Basis
+from poly import Polynomial, Basis, MODULUS
+from curve import primitive_root
 
 
 @dataclass
@@ -28,11 +29,24 @@ class CommonPreprocessedInput:
     S2: Polynomial
     # S_σ3(X) third permutation polynomial S_σ3(X)
     S3: Polynomial
+    # Whether proofs extend to the fixed coset generated by the primitive root,
+    # rather than to one drawn from the transcript
+    fixed_coset: bool = False
+    # In fixed-coset mode, the expansions of the polynomials above over that
+    # coset, by field name, so that they are computed once per circuit
+    coset_expansions: Optional[dict[str, Polynomial]] = None
 
 
 class Program:
     constraints: list[AssemblyEqn]
     group_order: int
+    # Every variable used by the program, in order of first use. The position
+    # of a variable in this list is its id; None (no variable) always has id 0
+    variables: list[Optional[str]]
+    variable_ids: dict[Optional[str], int]
+    # For each of the L, R and O columns, the id of the variable on that wire
+    # in each of the `group_order` rows (0 for unused wires and padding rows)
+    wire_ids: dict[Column, list[int]]
 
     def __init__(self, constraints: list[str], group_order: int):
         if len(constraints) > group_order:
@@ -40,11 +54,42 @@ class Program:
         assembly = [eq_to_assembly(constraint) for constraint in constraints]
         self.constraints = assembly
         self.group_order = group_order
+        self.compile_wires()
+
+    # Fills in the variable table and the wire ids from the constraints
+    def compile_wires(self):
+        self.variables = [None]
+        self.variable_ids = {None: 0}
+        self.wire_ids = {column: [0] * self.group_order for column in Column.variants()}
+        for row, wires in enumerate(self.wires()):
+            for column, name in zip(Column.variants(), wires.as_list()):
+                if name not in self.variable_ids:
+                    self.variable_ids[name] = len(self.variables)
+                    self.variables.append(name)
+                self.wire_ids[column][row] = self.variable_ids[name]
+
+    # Converts a witness given as {variable name: value} into a dense list of
+    # reduced ints, indexed by variable id. None (no variable) is 0 unless
+    # given; any other variable missing from the witness is a KeyError
+    def dense_witness(self, witness: dict[Optional[str], int]) -> list[int]:
+        return [
+            int(witness.get(None, 0) if name is None else witness[name]) % MODULUS
+            for name in self.variables
+        ]
+
+    # The values on each of the L, R and O wires in every row, as reduced ints,
+    # given a dense witness
+    def wire_values(self, witness: list[int]) -> dict[Column, list[int]]:
+        return {
+            column: [witness[i] for i in ids] for column, ids in self.wire_ids.items()
+        }
 
-    def common_preprocessed_input(self) -> CommonPreprocessedInput:
+    def common_preprocessed_input(
+        self, fixed_coset: bool = False
+    ) -> CommonPreprocessedInput:
         L, R, M, O, C = self.make_gate_polynomials()
         S = self.make_s_polynomials()
-        return CommonPreprocessedInput(
+        pk = CommonPreprocessedInput(
             self.group_order,
             M,
             L,
@@ -54,7 +99,16 @@ class Program:
             S[Column.LEFT],
             S[Column.RIGHT],
             S[Column.OUTPUT],
+            fixed_coset,
         )
+        if fixed_coset:
+            pk.coset_expansions = {
+                name: getattr(pk, name).to_coset_extended_lagrange(
+                    Scalar(primitive_root)
+                )
+                for name in ("QM", "QL", "QR", "QO", "QC", "S1", "S2", "S3")
+            }
+        return pk
 
     @classmethod
     def from_str(cls, constraints: str, group_order: int):
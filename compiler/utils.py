@@ -1,4 +1,5 @@
 from utils import *
+from poly import EvaluationDomain
 from enum import Enum
 from dataclasses import dataclass
 
@@ -44,7 +45,9 @@ class Cell:
     # (column, row) pair. Expects section = 1 for left, 2 right, 3 output
     def label(self, group_order: int) -> Scalar:
         assert self.row < group_order
-        return Scalar.roots_of_unity(group_order)[self.row] * self.column.value
+        return Scalar(
+            EvaluationDomain.get(group_order).roots[self.row] * self.column.value
+        )
 
 
 # Gets the key to use in the coeffs dictionary for the term for key1*key2,
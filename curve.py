@@ -1,6 +1,8 @@
 from py_ecc.fields.field_elements import FQ as Field
 import py_ecc.bn128 as b
-from typing import NewType
+import py_ecc.optimized_bn128 as ob
+from py_ecc.optimized_bn128 import optimized_pairing as op
+from typing import NewType, Optional, Union
 
 primitive_root = 5
 G1Point = NewType("G1Point", tuple[b.FQ, b.FQ])
@@ -27,21 +29,77 @@ class Scalar(Field):
 Base = NewType("Base", b.FQ)
 
 
+# Inverts every element of `values` (given as ints) using Montgomery's trick:
+# a single modular inversion of the product of all the values, plus about 3n
+# multiplications to peel the individual inverses back out of it. None of the
+# values may be zero. Works for any prime modulus, by default the scalar field
+def batch_inverse(values: list[int], modulus: int = b.curve_order) -> list[int]:
+    # prefix_products[i] = values[0] * ... * values[i - 1]
+    prefix_products = [1] * len(values)
+    acc = 1
+    for i, value in enumerate(values):
+        prefix_products[i] = acc
+        acc = acc * value % modulus
+    acc_inv = pow(acc, -1, modulus)
+    o = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        # acc_inv = 1 / (values[0] * ... * values[i])
+        o[i] = prefix_products[i] * acc_inv % modulus
+        acc_inv = acc_inv * values[i] % modulus
+    return o
+
+
+# Multiplies a point by a scalar. G1 points go through ec_lincomb, and so get
+# the GLV split of the scalar
 def ec_mul(pt, coeff):
     if hasattr(coeff, "n"):
         coeff = coeff.n
-    return b.multiply(pt, coeff % b.curve_order)
+    if not is_g1(pt):
+        return b.multiply(pt, coeff % b.curve_order)
+    return ec_lincomb([(pt, coeff)])
 
 
-# Elliptic curve linear combination. A truly optimized implementation
-# would replace this with a fast lin-comb algo, see https://ethresear.ch/t/7238
+# Elliptic curve linear combination. Small combinations (like the verifier's,
+# with a handful of full-size scalars) use Straus' interleaved method with
+# wNAF digits, larger ones the Pippenger bucket method (see `straus` and
+# `pippenger` below). The older multi-subset based algorithm, see
+# https://ethresear.ch/t/7238, is kept below as `lincomb`. Works over G1
+# only; points are moved into Jacobian coordinates for the duration of the
+# computation and converted back to affine once at the end. Every term
+# k * P is first split into k_1 * P + k_2 * phi(P) with k_1, k_2 of about
+# 127 bits (see glv_decompose), which halves the chain of doublings; a
+# negative k_i is applied to the negated point
 def ec_lincomb(pairs):
-    return lincomb(
-        [pt for (pt, _) in pairs],
-        [int(n) % b.curve_order for (_, n) in pairs],
-        b.add,
-        b.Z1,
-    )
+    points, factors = [], []
+    for pt, n in pairs:
+        jacobian_pt = to_jacobian(pt)
+        k_1, k_2 = glv_decompose(int(n))
+        for point, factor in (
+            (jacobian_pt, k_1),
+            (jacobian_endomorphism(jacobian_pt), k_2),
+        ):
+            points.append(jacobian_neg(point) if factor < 0 else point)
+            factors.append(abs(factor))
+    if len(points) <= STRAUS_MAX_POINTS:
+        o = straus(
+            points,
+            factors,
+            jacobian_add,
+            JACOBIAN_ZERO,
+            jacobian_double,
+            jacobian_neg,
+            batch_affine_add,
+        )
+    else:
+        o = pippenger(
+            points,
+            factors,
+            jacobian_add,
+            JACOBIAN_ZERO,
+            jacobian_double,
+            batch_affine_add,
+        )
+    return from_jacobian(o)
     # Equivalent to:
     # o = b.Z1
     # for pt, coeff in pairs:
@@ -49,6 +107,383 @@ def ec_lincomb(pairs):
     # return o
 
 
+# Up to this many points (after the GLV split, so half as many terms),
+# ec_lincomb uses Straus rather than Pippenger. Straus costs about bitlen / 6
+# additions per point, and Pippenger needs a large window (and so many
+# points to share its buckets) to do better; with the 127-bit scalars of the
+# GLV split the two break even at around 128 to 256 points
+STRAUS_MAX_POINTS = 192
+
+
+# Reduces a scalar modulo curve_order to the representative closest to zero,
+# returned as (absolute value, whether it is negative)
+def signed_scalar(n) -> tuple[int, bool]:
+    n = int(n) % b.curve_order
+    if n > b.curve_order // 2:
+        return b.curve_order - n, True
+    return n, False
+
+
+# Checks that e(Q_1, P_1) * e(Q_2, P_2) * ... == 1 for the given (G2, G1) point
+# pairs. The Miller loops are multiplied together and share a single final
+# exponentiation, which is as expensive as a whole Miller loop; an equality
+# e(Q_1, P_1) == e(Q_2, P_2) is checked as [(Q_1, P_1), (Q_2, -P_2)]. The points
+# are converted to py_ecc's optimized (projective) representation for this.
+# G2 points that are reused across many checks can be passed as
+# PreparedG2Points (see prepare_g2), whose Miller loops are much cheaper.
+# Points are plain py_ecc points (or G1Points, G2Points), and pairs with the
+# point at infinity (None) on either side are skipped
+def pairing_check(
+    pairs: list[
+        tuple[
+            Union[tuple[b.FQ2, b.FQ2], "PreparedG2Point", None],
+            Optional[tuple[b.FQ, b.FQ]],
+        ]
+    ],
+) -> bool:
+    f = ob.FQ12.one()
+    prepared: list[tuple[PreparedG2Point, tuple[b.FQ, b.FQ]]] = []
+    for Q, P in pairs:
+        if Q is None or P is None:
+            continue
+        if isinstance(Q, PreparedG2Point):
+            prepared.append((Q, P))
+            continue
+        f *= ob.pairing(
+            to_optimized_g2(Q),
+            (ob.FQ(int(P[0])), ob.FQ(int(P[1])), ob.FQ.one()),
+            final_exponentiate=False,
+        )
+    if prepared:
+        f *= prepared_miller_loop(prepared)
+    return ob.final_exponentiate(f) == ob.FQ12.one()
+
+
+# Converts an affine G2 point to py_ecc's optimized (projective) form
+def to_optimized_g2(Q: tuple[b.FQ2, b.FQ2]):
+    x, y = Q
+    return (
+        ob.FQ2([int(c) for c in x.coeffs]),
+        ob.FQ2([int(c) for c in y.coeffs]),
+        ob.FQ2.one(),
+    )
+
+
+################################################################
+# Prepared G2 points
+################################################################
+
+# Most of the cost of a Miller loop is in stepping the G2 point R through
+# Q, 2Q, 3Q ... (in the degree 12 extension) and finding the line through each
+# step. None of that depends on the G1 point, so for a G2 point that is paired
+# many times (like the ones of a verification key) the lines can be computed
+# once. Each line y = m * x + (y_1 - m * x_1) is stored as the coefficients of
+# m and of c = y_1 - m * x_1, and evaluating it at an affine G1 point (x, y)
+# is then just m * x + c - y. The loop follows py_ecc's reference bn128
+# miller_loop, so the results match after the final exponentiation.
+
+
+class PreparedG2Point:
+    """A G2 point together with the lines of its Miller loop"""
+
+    __slots__ = ("point", "lines")
+
+    point: G2Point
+    # One (m, c) pair of coefficient tuples per step of MILLER_SCHEDULE
+    lines: list[tuple[tuple[int, ...], tuple[int, ...]]]
+
+    def __init__(self, point: G2Point):
+        self.point = point
+        self.lines = _miller_lines(point)
+
+
+def prepare_g2(Q: G2Point) -> PreparedG2Point:
+    return PreparedG2Point(Q)
+
+
+# For each line of the Miller loop, in order, whether f is squared before the
+# line is multiplied in: squarings come with the doubling steps, one per bit of
+# the loop count, each optionally followed by an addition step; the loop ends
+# with two lines for the Frobenius images of Q
+def _miller_schedule() -> list[bool]:
+    schedule = []
+    for i in range(op.log_ate_loop_count, -1, -1):
+        schedule.append(True)
+        if op.ate_loop_count & (2**i):
+            schedule.append(False)
+    return schedule + [False, False]
+
+
+MILLER_SCHEDULE = _miller_schedule()
+
+
+def _miller_lines(Q: G2Point) -> list[tuple[tuple[int, ...], tuple[int, ...]]]:
+    q = op.field_modulus
+    twisted = ob.normalize(ob.twist(to_optimized_g2(Q)))
+    lines = []
+
+    # Appends the line through R and T (the tangent at R if they are equal),
+    # and returns R + T
+    def step(R, T):
+        (x1, y1), (x2, y2) = R, T
+        if x1 == x2:
+            m = x1 * x1 * 3 / (y1 * 2)
+        else:
+            m = (y2 - y1) / (x2 - x1)
+        lines.append((m.coeffs, (y1 - m * x1).coeffs))
+        x3 = m * m - x1 - x2
+        return (x3, m * (x1 - x3) - y1)
+
+    R = twisted
+    for i in range(op.log_ate_loop_count, -1, -1):
+        R = step(R, R)
+        if op.ate_loop_count & (2**i):
+            R = step(R, twisted)
+    Q1 = (twisted[0] ** q, twisted[1] ** q)
+    nQ2 = (Q1[0] ** q, -(Q1[1] ** q))
+    R = step(R, Q1)
+    step(R, nQ2)
+    assert len(lines) == len(MILLER_SCHEDULE)
+    return lines
+
+
+# The product of the Miller loops of the given (prepared G2, G1) pairs, before
+# the final exponentiation. The loops run side by side, so f is only squared
+# once per step for all of them. Like py_ecc's pairing, this rejects G1 points
+# that are not on the curve with a ValueError: the lines would happily be
+# evaluated at them otherwise
+def prepared_miller_loop(pairs: list[tuple[PreparedG2Point, tuple[b.FQ, b.FQ]]]):
+    for _, P in pairs:
+        if not b.is_on_curve(P, b.b):
+            raise ValueError("Invalid input - point P is not on the correct curve")
+    q = op.field_modulus
+    points = [(Q.lines, int(P[0]), int(P[1])) for Q, P in pairs]
+    f = ob.FQ12.one()
+    for k, square in enumerate(MILLER_SCHEDULE):
+        if square:
+            f = f * f
+        for lines, x, y in points:
+            m, c = lines[k]
+            value = [(m_i * x + c_i) % q for m_i, c_i in zip(m, c)]
+            value[0] = (value[0] - y) % q
+            f = f * ob.FQ12(value)
+    return f
+
+
+################################################################
+# Jacobian G1 arithmetic
+################################################################
+
+# py_ecc works in affine coordinates, which costs a field inversion on every
+# addition. Internally we instead represent a G1 point as a tuple of ints
+# (X, Y, Z) standing for the affine point (X / Z**2, Y / Z**3); the point at
+# infinity is any tuple with Z = 0. Conversion back to affine (and so the
+# one inversion) only happens at the API boundary.
+
+JACOBIAN_ZERO = (1, 1, 0)
+
+
+def is_g1(pt) -> bool:
+    return pt is None or isinstance(pt[0], b.FQ)
+
+
+def to_jacobian(pt: G1Point):
+    if pt is None:
+        return JACOBIAN_ZERO
+    return (int(pt[0]), int(pt[1]), 1)
+
+
+def from_jacobian(pt) -> Optional[G1Point]:
+    x, y, z = pt
+    if z == 0:
+        return b.Z1
+    q = b.field_modulus
+    z_inv = pow(z, -1, q)
+    z_inv_squared = z_inv * z_inv % q
+    return G1Point((b.FQ(x * z_inv_squared % q), b.FQ(y * z_inv_squared * z_inv % q)))
+
+
+def jacobian_neg(pt):
+    x, y, z = pt
+    return (x, -y % b.field_modulus, z)
+
+
+# Doubling formula "dbl-2009-l" for curves with a = 0, see
+# https://hyperelliptic.org/EFD/g1p/auto-shortw-jacobian-0.html
+def jacobian_double(pt):
+    x, y, z = pt
+    if z == 0 or y == 0:
+        return JACOBIAN_ZERO
+    q = b.field_modulus
+    A = x * x % q
+    B = y * y % q
+    C = B * B % q
+    D = 2 * ((x + B) ** 2 - A - C) % q
+    E = 3 * A % q
+    x3 = (E * E - 2 * D) % q
+    y3 = (E * (D - x3) - 8 * C) % q
+    z3 = 2 * y * z % q
+    return (x3, y3, z3)
+
+
+# Addition formulas "add-2007-bl", and "madd-2007-bl" when the second point
+# has Z = 1 (as freshly converted affine points do), from the same page
+def jacobian_add(p1, p2):
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    if z1 == 0:
+        return p2
+    if z2 == 0:
+        return p1
+    q = b.field_modulus
+    z1z1 = z1 * z1 % q
+    u2 = x2 * z1z1 % q
+    s2 = y2 * z1 * z1z1 % q
+    if z2 == 1:
+        u1 = x1
+        s1 = y1
+    else:
+        z2z2 = z2 * z2 % q
+        u1 = x1 * z2z2 % q
+        s1 = y1 * z2 * z2z2 % q
+    h = (u2 - u1) % q
+    r = 2 * (s2 - s1) % q
+    if h == 0:
+        if r == 0:
+            return jacobian_double(p1)
+        return JACOBIAN_ZERO
+    i = 4 * h * h % q
+    j = h * i % q
+    v = u1 * i % q
+    x3 = (r * r - j - 2 * v) % q
+    y3 = (r * (v - x3) - 2 * s1 * j) % q
+    if z2 == 1:
+        z3 = 2 * z1 * h % q
+    else:
+        z3 = 2 * z1 * z2 * h % q
+    return (x3, y3, z3)
+
+
+# Adds up many independent pairs of points at once, in affine coordinates.
+# Each affine addition needs the inverse of x_2 - x_1 (or of 2 * y_1 for a
+# doubling) for the slope of its line, and batch_inverse shares a single
+# field inversion among all of them, which makes these additions cheaper
+# than Jacobian ones. The points, and the sums, are Jacobian points with
+# Z = 1, or the point at infinity
+def batch_affine_add(pairs):
+    q = b.field_modulus
+    denominators = []
+    for (x1, y1, z1), (x2, y2, z2) in pairs:
+        if z1 == 0 or z2 == 0:
+            continue
+        if x1 != x2:
+            denominators.append((x2 - x1) % q)
+        elif y1 == y2 and y1 != 0:
+            denominators.append(2 * y1 % q)
+    inverses = iter(batch_inverse(denominators, q))
+    o = []
+    for p1, p2 in pairs:
+        x1, y1, z1 = p1
+        x2, y2, z2 = p2
+        if z1 == 0:
+            o.append(p2)
+            continue
+        if z2 == 0:
+            o.append(p1)
+            continue
+        if x1 != x2:
+            m = (y2 - y1) * next(inverses) % q
+        elif y1 == y2 and y1 != 0:
+            m = 3 * x1 * x1 * next(inverses) % q
+        else:
+            o.append(JACOBIAN_ZERO)
+            continue
+        x3 = (m * m - x1 - x2) % q
+        o.append((x3, (m * (x1 - x3) - y1) % q, 1))
+    return o
+
+
+# Fixed-base precomputation: for a point P that is reused across many linear
+# combinations, store P, 2**c * P, 2**(2c) * P, ... (one entry per c-bit
+# window of a scalar) as Jacobian points with Z = 1. A linear combination
+# over such points then needs no doublings at all: every (point, window)
+# pair just goes into the bucket of its c-bit digit. The tables of all the
+# given points are built side by side, so that every doubling step is one
+# batch_affine_add over all of them
+def fixed_base_tables(points: list[G1Point], window_bits: int, bitlen=254):
+    current = [to_jacobian(pt) for pt in points]
+    o: list[list[tuple[int, int, int]]] = [[] for _ in points]
+    for window in range((bitlen + window_bits - 1) // window_bits):
+        if window:
+            for _ in range(window_bits):
+                current = batch_affine_add([(pt, pt) for pt in current])
+        for table, pt in zip(o, current):
+            table.append(pt)
+    return o
+
+
+def fixed_base_lincomb(tables, coeffs, window_bits: int):
+    mask = (1 << window_bits) - 1
+    buckets = [JACOBIAN_ZERO] * (mask + 1)
+    for table, coeff in zip(tables, coeffs):
+        coeff, negate = signed_scalar(coeff)
+        for entry in table:
+            if coeff == 0:
+                break
+            digit = coeff & mask
+            if digit:
+                if negate:
+                    entry = jacobian_neg(entry)
+                buckets[digit] = jacobian_add(buckets[digit], entry)
+            coeff >>= window_bits
+    running_sum = JACOBIAN_ZERO
+    o = JACOBIAN_ZERO
+    for digit in range(mask, 0, -1):
+        running_sum = jacobian_add(running_sum, buckets[digit])
+        o = jacobian_add(o, running_sum)
+    return from_jacobian(o)
+
+
+################################################################
+# GLV endomorphism
+################################################################
+
+# For a cube root of unity beta in the base field, phi(x, y) = (beta * x, y)
+# maps G1 to itself, and on G1 it acts as multiplication by a cube root of
+# unity lambda in the scalar field: phi(P) = lambda * P. So k * P can be
+# computed as k_1 * P + k_2 * phi(P) for any k_1 + k_2 * lambda = k, and
+# there always are such k_1, k_2 of about half the bit length of k
+# (Gallant, Lambert and Vanstone, "Faster point multiplication on elliptic
+# curves with efficient endomorphisms", 2001)
+GLV_BETA = 0x59E26BCEA0D48BACD4F263F1ACDB5C4F5763473177FFFFFE
+GLV_LAMBDA = 0xB3C4D79D41A917585BFC41088D8DAAA78B17EA66B99C90DD
+# A short basis (a_1, b_1), (a_2, b_2) of the lattice of vectors (x, y) with
+# x + y * lambda = 0 (mod curve_order), found with the extended Euclidean
+# algorithm on (curve_order, lambda); a_1 * b_2 - a_2 * b_1 = curve_order
+GLV_BASIS = (
+    (0x89D3256894D213E3, -0x6F4D8248EEB859FC8211BBEB7D4F1128),
+    (0x6F4D8248EEB859FD0BE4E1541221250B, 0x89D3256894D213E3),
+)
+
+
+def jacobian_endomorphism(pt):
+    x, y, z = pt
+    return (GLV_BETA * x % b.field_modulus, y, z)
+
+
+# Splits k into (k_1, k_2), both of at most about 128 bits and either of
+# them possibly negative, with k_1 + k_2 * lambda = k (mod curve_order). This
+# subtracts from (k, 0) the lattice vector closest to it, found by rounding
+# the coordinates of (k, 0) in the short basis
+def glv_decompose(k: int) -> tuple[int, int]:
+    k %= b.curve_order
+    (a_1, b_1), (a_2, b_2) = GLV_BASIS
+    n = b.curve_order
+    c_1 = (2 * b_2 * k + n) // (2 * n)
+    c_2 = (-2 * b_1 * k + n) // (2 * n)
+    return k - c_1 * a_1 - c_2 * a_2, -c_1 * b_1 - c_2 * b_2
+
+
 ################################################################
 # multicombs
 ################################################################
@@ -56,7 +491,12 @@ def ec_lincomb(pairs):
 import random, sys, math
 
 
-def multisubset(numbers, subsets, adder=lambda x, y: x + y, zero=0):
+# `batch_adder`, if given, adds up a list of independent pairs at once (like
+# batch_affine_add); the power sets are built and the subset sums are added
+# up in layers of such additions
+def multisubset(numbers, subsets, adder=lambda x, y: x + y, zero=0, batch_adder=None):
+    if batch_adder is None:
+        batch_adder = lambda pairs: [adder(x, y) for x, y in pairs]
     # Split up the numbers into partitions
     partition_size = 1 + int(math.log(len(subsets) + 1))
     # Align number count to partition size (for simplicity)
@@ -68,22 +508,42 @@ def multisubset(numbers, subsets, adder=lambda x, y: x + y, zero=0):
     for i in range(0, len(numbers), partition_size):
         new_power_set = [zero]
         for dimension, value in enumerate(numbers[i : i + partition_size]):
-            new_power_set += [adder(n, value) for n in new_power_set]
+            new_power_set += batch_adder([(n, value) for n in new_power_set])
         power_sets.append(new_power_set)
     # Compute subset sums, using elements from power set for each range of values
     # ie. with a single power set lookup you can get the sum of _all_ elements in
     # the range partition_size*k...partition_size*(k+1) that are in that subset
-    subset_sums = []
+    lookups = []
     for subset in subsets:
-        o = zero
+        subset_lookups = []
         for i in range(len(power_sets)):
             index_in_power_set = 0
             for j in range(partition_size):
                 if i * partition_size + j in subset:
                     index_in_power_set += 2**j
-            o = adder(o, power_sets[i][index_in_power_set])
-        subset_sums.append(o)
-    return subset_sums
+            if index_in_power_set:
+                subset_lookups.append(power_sets[i][index_in_power_set])
+        lookups.append(subset_lookups)
+    return batch_sums(lookups, batch_adder, zero)
+
+
+# Sums up each of the given lists of numbers. Rather than one list after the
+# other, this adds up neighbouring numbers in all the lists at once, in
+# layers, so that each layer is a single batch_adder call
+def batch_sums(groups, batch_adder, zero=0):
+    groups = [list(group) for group in groups]
+    while any(len(group) > 1 for group in groups):
+        sums = iter(
+            batch_adder(
+                [pair for group in groups for pair in zip(group[0::2], group[1::2])]
+            )
+        )
+        for i, group in enumerate(groups):
+            new_group = [next(sums) for _ in range(len(group) // 2)]
+            if len(group) % 2:
+                new_group.append(group[-1])
+            groups[i] = new_group
+    return [group[0] if group else zero for group in groups]
 
 
 # Reduces a linear combination `numbers[0] * factors[0] + numbers[1] * factors[1] + ...`
@@ -111,6 +571,131 @@ def lincomb(numbers, factors, adder=lambda x, y: x + y, zero=0):
     return o
 
 
+# Picks the Pippenger window size c that minimizes the approximate cost of
+# ceil(bitlen / c) windows, each needing `count` bucket additions plus
+# 2 * 2**c additions to sum up the buckets
+def pippenger_window_size(count, bitlen=254):
+    return min(
+        range(1, 17), key=lambda c: ((bitlen + c - 1) // c) * (count + 2 ** (c + 1))
+    )
+
+
+# Computes `numbers[0] * factors[0] + numbers[1] * factors[1] + ...` with the
+# Pippenger bucket method. The factors are cut into windows of c bits; for each
+# window (most significant first) we double the accumulator c times, drop every
+# number into the bucket matching its c-bit digit, and add
+# `1 * bucket_1 + 2 * bucket_2 + ...` to the accumulator using a running sum.
+# The buckets are filled with batch_sums, so with a `batch_adder` (see
+# multisubset) all of a window's bucket additions go in a few batches
+def pippenger(
+    numbers, factors, adder=lambda x, y: x + y, zero=0, doubler=None, batch_adder=None
+):
+    if doubler is None:
+        doubler = lambda x: adder(x, x)
+    if batch_adder is None:
+        batch_adder = lambda pairs: [adder(x, y) for x, y in pairs]
+    maxbitlen = max([f.bit_length() for f in factors], default=0)
+    if maxbitlen == 0:
+        return zero
+    c = pippenger_window_size(len(numbers), maxbitlen)
+    mask = (1 << c) - 1
+    o = zero
+    for window in range((maxbitlen + c - 1) // c - 1, -1, -1):
+        for _ in range(c):
+            o = doubler(o)
+        shift = window * c
+        groups = [[] for _ in range(mask + 1)]
+        for number, factor in zip(numbers, factors):
+            digit = (factor >> shift) & mask
+            if digit:
+                groups[digit].append(number)
+        buckets = batch_sums(groups, batch_adder, zero)
+        # running_sum holds bucket_d + ... + bucket_max, so adding it once for
+        # every d adds each bucket_d exactly d times
+        running_sum = zero
+        window_sum = zero
+        for digit in range(mask, 0, -1):
+            running_sum = adder(running_sum, buckets[digit])
+            window_sum = adder(window_sum, running_sum)
+        o = adder(o, window_sum)
+    return o
+
+
+# Signed window-w NAF of k, least significant digit first: every digit is
+# zero or odd with absolute value below 2**(w-1), and any nonzero digit is
+# followed by at least w - 1 zeros, so on average one digit in w + 1 is set
+def wnaf(k: int, w: int) -> list[int]:
+    o = []
+    while k:
+        if k & 1:
+            digit = k & ((1 << w) - 1)
+            if digit >= 1 << (w - 1):
+                digit -= 1 << w
+            k -= digit
+        else:
+            digit = 0
+        o.append(digit)
+        k >>= 1
+    return o
+
+
+# Picks the wNAF width w that minimizes the approximate cost of the
+# 2**(w-2) additions to build the table of odd multiples plus one addition
+# per nonzero digit
+def wnaf_window_size(bitlen):
+    return min(range(2, 9), key=lambda w: 2 ** (w - 2) + bitlen / (w + 1))
+
+
+# Computes `numbers[0] * factors[0] + numbers[1] * factors[1] + ...` with
+# Straus' method: a single chain of doublings shared by all the numbers, into
+# which each number's digits are added as they come up. Each factor is written
+# in wNAF, so for every number we only precompute its odd multiples
+# 1, 3, ... 2**(w-1) - 1 and negate those for negative digits. This beats
+# Pippenger when there are few numbers, since it needs no buckets to sum up.
+# `batch_adder` is as in multisubset
+def straus(
+    numbers,
+    factors,
+    adder=lambda x, y: x + y,
+    zero=0,
+    doubler=None,
+    negator=None,
+    batch_adder=None,
+):
+    if doubler is None:
+        doubler = lambda x: adder(x, x)
+    if negator is None:
+        negator = lambda x: -x
+    if batch_adder is None:
+        batch_adder = lambda pairs: [adder(x, y) for x, y in pairs]
+    digits, tables, sizes = [], [], []
+    for number, factor in zip(numbers, factors):
+        if factor == 0:
+            continue
+        w = wnaf_window_size(factor.bit_length())
+        digits.append(wnaf(factor, w))
+        tables.append([number])
+        sizes.append(2 ** (w - 2))
+    # The tables are built side by side, one batch_adder call per entry
+    twice = batch_adder([(table[0], table[0]) for table in tables])
+    for j in range(1, max(sizes, default=0)):
+        growing = [i for i in range(len(tables)) if sizes[i] > j]
+        sums = batch_adder([(tables[i][-1], twice[i]) for i in growing])
+        for i, entry in zip(growing, sums):
+            tables[i].append(entry)
+    o = zero
+    for i in range(max(map(len, digits), default=0) - 1, -1, -1):
+        o = doubler(o)
+        for number_digits, table in zip(digits, tables):
+            if i < len(number_digits) and number_digits[i]:
+                digit = number_digits[i]
+                if digit > 0:
+                    o = adder(o, table[digit >> 1])
+                else:
+                    o = adder(o, negator(table[-digit >> 1]))
+    return o
+
+
 # Tests go here
 def make_mock_adder():
     counter = [0]
@@ -149,5 +734,85 @@ def test_lincomb(numcount, bitlength=256):
     )
 
 
+def test_pippenger(numcount, bitlength=256):
+    numbers = [random.randrange(10**20) for _ in range(numcount)]
+    factors = [random.randrange(2**bitlength) for _ in range(numcount)]
+    adder, counter = make_mock_adder()
+    o = pippenger(numbers, factors, adder=adder)
+    assert o == sum([n * f for n, f in zip(numbers, factors)])
+    total_ones = sum(bin(f).count("1") for f in factors)
+    print("Naive operation count: %d" % (bitlength * numcount + total_ones))
+    print("Pippenger operation count: %d" % counter[0])
+    print(
+        "Optimization factor: %.2f" % ((bitlength * numcount + total_ones) / counter[0])
+    )
+
+
+def test_straus(numcount, bitlength=256):
+    numbers = [random.randrange(10**20) for _ in range(numcount)]
+    factors = [random.randrange(2**bitlength) for _ in range(numcount)]
+    adder, counter = make_mock_adder()
+    o = straus(numbers, factors, adder=adder)
+    assert o == sum([n * f for n, f in zip(numbers, factors)])
+    total_ones = sum(bin(f).count("1") for f in factors)
+    print("Naive operation count: %d" % (bitlength * numcount + total_ones))
+    print("Straus operation count: %d" % counter[0])
+    print(
+        "Optimization factor: %.2f" % ((bitlength * numcount + total_ones) / counter[0])
+    )
+
+
+def test_ec_lincomb():
+    pairs = [(ec_mul(b.G1, i + 2), random.randrange(b.curve_order)) for i in range(5)]
+    pairs += [(b.G1, -1), (ec_mul(b.G1, 7), -random.randrange(2**128))]
+    expected = b.Z1
+    for pt, coeff in pairs:
+        expected = b.add(expected, b.multiply(pt, coeff % b.curve_order))
+    assert ec_lincomb(pairs) == expected
+    print("EC lincomb OK")
+
+
+def test_glv():
+    P = ec_mul(b.G1, random.randrange(1, b.curve_order))
+    assert b.multiply(P, GLV_LAMBDA) == (P[0] * GLV_BETA, P[1])
+    for k in [0, 1, b.curve_order - 1] + [
+        random.randrange(b.curve_order) for _ in range(100)
+    ]:
+        k_1, k_2 = glv_decompose(k)
+        assert (k_1 + k_2 * GLV_LAMBDA - k) % b.curve_order == 0
+        assert abs(k_1).bit_length() <= 128 and abs(k_2).bit_length() <= 128
+    print("GLV OK")
+
+
+def test_batch_affine_add():
+    P = to_jacobian(ec_mul(b.G1, random.randrange(1, b.curve_order)))
+    Q = to_jacobian(ec_mul(b.G1, random.randrange(1, b.curve_order)))
+    pairs = [(P, Q), (P, P), (P, jacobian_neg(P)), (JACOBIAN_ZERO, Q)]
+    for (p1, p2), total in zip(pairs, batch_affine_add(pairs)):
+        assert from_jacobian(total) == from_jacobian(jacobian_add(p1, p2))
+    print("Batch affine addition OK")
+
+
+def test_pairing_check():
+    a, c = random.randrange(1, b.curve_order), random.randrange(1, b.curve_order)
+    P, Q = ec_mul(b.G1, a), b.multiply(b.G2, c)
+    assert pairing_check([(Q, P), (b.G2, b.neg(ec_mul(b.G1, a * c)))])
+    assert not pairing_check([(Q, P), (b.G2, b.neg(ec_mul(b.G1, a * c + 1)))])
+    prepared = prepare_g2(b.G2)
+    assert pairing_check([(Q, P), (prepared, b.neg(ec_mul(b.G1, a * c)))])
+    try:
+        pairing_check([(prepared, (b.FQ(0), b.FQ(2)))])
+        assert False, "off-curve point accepted"
+    except ValueError:
+        pass
+    print("Pairing check OK")
+
+
 if __name__ == "__main__":
     test_lincomb(int(sys.argv[1]) if len(sys.argv) >= 2 else 80)
+    test_pippenger(int(sys.argv[1]) if len(sys.argv) >= 2 else 80)
+    test_straus(int(sys.argv[1]) if len(sys.argv) >= 2 else 10)
+    test_glv()
+    test_batch_affine_add()
+    test_ec_lincomb()
+    test_pairing_check()
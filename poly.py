@@ -1,5 +1,10 @@
-from curve import Scalar
+from curve import Scalar, batch_inverse, primitive_root
 from enum import Enum
+from functools import cached_property, lru_cache
+from operator import mul
+from typing import Optional
+
+MODULUS = Scalar.field_modulus
 
 
 class Basis(Enum):
@@ -7,105 +12,536 @@ class Basis(Enum):
     MONOMIAL = 2
 
 
+class EvaluationDomain:
+    """The points `offset * ω**i` for i in [0, size), where ω is the first
+    root of unity of order `size`, plus everything that FFTs and evaluations
+    over these points need, as ints. Each value is computed on first use and
+    then kept, and domains themselves are cached, so always construct them
+    through `EvaluationDomain.get(size, offset)`. Only the subgroups and the
+    fixed coset (offset primitive_root) are cached: a random coset is drawn
+    anew for every proof, so its domain would never be hit again. It still
+    shares everything offset-independent with its (cached) subgroup."""
+
+    size: int
+    offset: Scalar
+
+    def __init__(self, size: int, offset: Scalar):
+        assert size & (size - 1) == 0
+        self.size = size
+        self.offset = offset
+
+    @classmethod
+    def get(cls, size: int, offset=1) -> "EvaluationDomain":
+        offset = int(offset)
+        if offset in CACHED_OFFSETS:
+            return _get_domain(size, offset)
+        return cls(size, Scalar(offset))
+
+    # The subgroup of the same size, which holds everything not depending
+    # on the offset
+    @cached_property
+    def subgroup(self) -> "EvaluationDomain":
+        if self.offset == 1:
+            return self
+        return EvaluationDomain.get(self.size)
+
+    # ω
+    @cached_property
+    def generator(self) -> Scalar:
+        if self.offset != 1:
+            return self.subgroup.generator
+        return Scalar.root_of_unity(self.size)
+
+    # [1, ω, ω**2 ... ω**(size-1)]
+    @cached_property
+    def roots(self) -> list[int]:
+        if self.offset != 1:
+            return self.subgroup.roots
+        return _powers(self.generator.n, self.size)
+
+    # [1, ω**-1, ω**-2 ... ω**-(size-1)]
+    @cached_property
+    def inv_roots(self) -> list[int]:
+        return [self.roots[0]] + self.roots[1:][::-1]
+
+    # Position i holds i with its log2(size) bits reversed
+    @cached_property
+    def bit_reversal(self) -> list[int]:
+        if self.offset != 1:
+            return self.subgroup.bit_reversal
+        top_bit = self.size >> 1
+        o = [0] * self.size
+        for i in range(1, self.size):
+            o[i] = (o[i >> 1] >> 1) | (top_bit if i & 1 else 0)
+        return o
+
+    # 1 / size
+    @cached_property
+    def size_inv(self) -> int:
+        return pow(self.size, -1, MODULUS)
+
+    # [1, offset**-1, offset**-2 ... offset**-(size-1)]
+    @cached_property
+    def offset_inv_powers(self) -> list[int]:
+        return _powers(pow(self.offset.n, -1, MODULUS), self.size)
+
+    # The points of the domain themselves: [offset * ω**i for i in range(size)]
+    @cached_property
+    def elements(self) -> list[int]:
+        if self.offset == 1:
+            return self.roots
+        offset = self.offset.n
+        return [offset * root % MODULUS for root in self.roots]
+
+    # Twiddle factors for each butterfly stage of the NTT: the stage
+    # combining blocks of size m uses [ω**(j * size / 2m) for j in range(m)]
+    @cached_property
+    def twiddles(self) -> list[list[int]]:
+        if self.offset != 1:
+            return self.subgroup.twiddles
+        return _stage_twiddles(self.roots)
+
+    # Same as `twiddles`, but for ω**-1, as needed for the inverse NTT
+    @cached_property
+    def inv_twiddles(self) -> list[list[int]]:
+        if self.offset != 1:
+            return self.subgroup.inv_twiddles
+        return _stage_twiddles(self.inv_roots)
+
+    # Weights w_i such that sum(values[i] * w_i) is the evaluation at x of the
+    # polynomial with the given values at the roots of unity, that is
+    # w_i = (x^n - 1) / n * ω^i / (x - ω^i). Cached per (domain, point), so
+    # evaluating several polynomials at the same point computes them once
+    def barycentric_weights(self, x: int) -> list[int]:
+        assert self.offset == 1
+        return _barycentric_weights(self.size, x % MODULUS)
+
+    # The evaluations of the vanishing polynomial X^n - 1 of the subgroup of
+    # size n over this domain. If the domain has size k * n, then
+    # (offset * ω**i)^n = offset^n * ω**(i * n) only depends on i mod k, so
+    # these are periodic with period k, and stored as such
+    def vanishing_evals(self, n: int) -> "PeriodicEvaluations":
+        assert self.size % n == 0
+        return _vanishing_evals(self.size, self.offset.n, n)
+
+    # Evaluates each polynomial that is `entries[i]` at ω^i, and 0 at every
+    # root of unity not in `entries`, at each of `points`. This is
+    # (x^n - 1) / n * sum(entries[i] * ω^i / (x - ω^i)), so it costs
+    # O(len(entries)) per point rather than O(n): much cheaper than FFTs or a
+    # full barycentric evaluation for sparse polynomials like L0 or PI. The
+    # polynomials share the inverses of x - ω^i, so evaluate polynomials at
+    # the same points in one call. `vanishing` can give x^n - 1 for each point
+    # when it is already known, which saves raising every point to the n-th
+    # power. Over a whole coset, use lagrange_coset_evals instead
+    def lagrange_evals(
+        self,
+        polys: list[dict[int, int]],
+        points: list[int],
+        vanishing: Optional[list[int]] = None,
+    ) -> list[list[int]]:
+        assert self.offset == 1
+        indices = sorted(
+            {i for entries in polys for i, v in entries.items() if v % MODULUS}
+        )
+        position = {i: j for j, i in enumerate(indices)}
+        terms = [
+            [
+                (position[i], value * self.roots[i] % MODULUS)
+                for i, value in entries.items()
+                if value % MODULUS
+            ]
+            for entries in polys
+        ]
+        points = [x % MODULUS for x in points]
+        if vanishing is None:
+            vanishing = [pow(x, self.size, MODULUS) - 1 for x in points]
+        # The terms are only well defined at points outside of the roots of unity
+        roots = [self.roots[i] for i in indices]
+        inv_differences = batch_inverse(
+            [
+                x - root
+                for x, x_to_n_minus_1 in zip(points, vanishing)
+                if x_to_n_minus_1 % MODULUS
+                for root in roots
+            ]
+        )
+        o: list[list[int]] = [[] for _ in polys]
+        pos = 0
+        for x, x_to_n_minus_1 in zip(points, vanishing):
+            if x_to_n_minus_1 % MODULUS == 0:
+                i = self.roots.index(x)
+                for evals, entries in zip(o, polys):
+                    evals.append(entries.get(i, 0) % MODULUS)
+                continue
+            factor = x_to_n_minus_1 * self.size_inv % MODULUS
+            for evals, poly_terms in zip(o, terms):
+                total = 0
+                for j, weighted_root in poly_terms:
+                    total += weighted_root * inv_differences[pos + j]
+                evals.append(total % MODULUS * factor % MODULUS)
+            pos += len(roots)
+        return o
+
+    # Same as lagrange_evals, at every point of a coset `domain` of size
+    # N = k * n that is disjoint from this subgroup, such as the extended coset
+    # of the quotient. There x_j * ω^-i = x_(j - k * i), so
+    # ω^i / (x_j - ω^i) = 1 / (x_(j - k * i) - 1): all the inverses are
+    # rotations of the single list [1 / (x_j - 1)], and x_j^n - 1 is given by
+    # vanishing_evals. Each nonzero entry then costs one multiplication per
+    # point
+    def lagrange_coset_evals(
+        self, polys: list[dict[int, int]], domain: "EvaluationDomain"
+    ) -> list[list[int]]:
+        assert self.offset == 1 and domain.size % self.size == 0
+        k = domain.size // self.size
+        vanishing = domain.vanishing_evals(self.size)
+        assert all(vanishing.values)
+        inv_shifted = batch_inverse([x - 1 for x in domain.elements])
+        factors = [v * self.size_inv % MODULUS for v in vanishing.values]
+        o = []
+        for entries in polys:
+            totals = [0] * domain.size
+            for i, value in entries.items():
+                value %= MODULUS
+                if value == 0:
+                    continue
+                shift = k * i
+                rotated = (
+                    inv_shifted[-shift:] + inv_shifted[:-shift]
+                    if shift
+                    else inv_shifted
+                )
+                totals = [t + value * inv for t, inv in zip(totals, rotated)]
+            o.append(
+                [t % MODULUS * factors[j % k] % MODULUS for j, t in enumerate(totals)]
+            )
+        return o
+
+    # Evaluates the polynomial with the given coefficients at the roots of
+    # unity [1, ω, ω**2 ... ω**(size-1)]. The input does not need to be reduced
+    def fft(self, values: list[int]) -> list[int]:
+        assert len(values) == self.size
+        return _ntt([values[i] for i in self.bit_reversal], self.twiddles)
+
+    # Evaluates the polynomial with the given n coefficients, where n divides
+    # the size k * n of this domain, over the whole domain. Point k * m + j is
+    # (offset * ω**j) * ω_n**m, so the evaluations at j, j + k, j + 2k ... are
+    # a size-n FFT of the coefficients scaled by (offset * ω**j)**i. That makes
+    # this k FFTs of size n rather than one of size k * n over mostly zeros,
+    # and each scaling is the previous one times ω**i
+    def extend(self, coeffs: list[int]) -> list[int]:
+        n = len(coeffs)
+        assert self.size % n == 0
+        k = self.size // n
+        subgroup = EvaluationDomain.get(n)
+        scaled = [
+            c * power % MODULUS for c, power in zip(coeffs, _powers(self.offset.n, n))
+        ]
+        o = [0] * self.size
+        for j in range(k):
+            if j:
+                scaled = [x * root % MODULUS for x, root in zip(scaled, self.roots)]
+            o[j::k] = subgroup.fft(scaled)
+        return o
+
+    # Inverse of `fft`: recovers the coefficients from the evaluations
+    def ifft(self, values: list[int]) -> list[int]:
+        assert len(values) == self.size
+        size_inv = self.size_inv
+        return [
+            x * size_inv % MODULUS
+            for x in _ntt([values[i] for i in self.bit_reversal], self.inv_twiddles)
+        ]
+
+
+# Offsets of the domains kept by EvaluationDomain.get
+CACHED_OFFSETS = (1, primitive_root)
+
+
+@lru_cache(maxsize=32)
+def _get_domain(size: int, offset: int) -> EvaluationDomain:
+    return EvaluationDomain(size, Scalar(offset))
+
+
+@lru_cache(maxsize=8)
+def _barycentric_weights(size: int, x: int) -> list[int]:
+    roots = EvaluationDomain.get(size).roots
+    x_to_n_minus_1 = pow(x, size, MODULUS) - 1
+    if x_to_n_minus_1 == 0:
+        # x is one of the roots of unity, so the evaluation is just the value there
+        return [1 if root == x else 0 for root in roots]
+    factor = x_to_n_minus_1 * EvaluationDomain.get(size).size_inv % MODULUS
+    return [
+        factor * root * inv_difference % MODULUS
+        for root, inv_difference in zip(
+            roots, batch_inverse([x - root for root in roots])
+        )
+    ]
+
+
+@lru_cache(maxsize=8)
+def _vanishing_evals(size: int, offset: int, n: int) -> "PeriodicEvaluations":
+    offset_to_n = pow(offset, n, MODULUS)
+    roots = EvaluationDomain.get(size).roots
+    return PeriodicEvaluations(
+        [(offset_to_n * roots[i * n] - 1) % MODULUS for i in range(size // n)]
+    )
+
+
+def _stage_twiddles(roots: list[int]) -> list[list[int]]:
+    size = len(roots)
+    o = []
+    m = 1
+    while m < size:
+        o.append(roots[: size // 2 : size // (2 * m)])
+        m *= 2
+    return o
+
+
+# Iterative in-place radix-2 Cooley-Tukey NTT over ints, with the input already
+# in bit-reversed order. Each stage combines pairs of blocks of size m into
+# blocks of size 2m. A stage has size / 2m blocks and m twiddles; whichever of
+# the two is smaller is looped over, and the other is handled with (strided)
+# slices, so there are at most sqrt(size) Python-level iterations per stage.
+def _ntt(a: list[int], twiddles: list[list[int]]) -> list[int]:
+    modulus = MODULUS
+    size = len(a)
+    m = 1
+    for stage_twiddles in twiddles:
+        step = 2 * m
+        if m < size // step:
+            for j in range(m):
+                w = stage_twiddles[j]
+                lo = a[j::step]
+                hi = a[j + m :: step]
+                if j:
+                    hi = [x * w % modulus for x in hi]
+                a[j::step] = [(x + y) % modulus for x, y in zip(lo, hi)]
+                a[j + m :: step] = [(x - y) % modulus for x, y in zip(lo, hi)]
+        else:
+            for start in range(0, size, step):
+                lo = a[start : start + m]
+                hi = [
+                    x * w % modulus
+                    for x, w in zip(a[start + m : start + step], stage_twiddles)
+                ]
+                a[start : start + m] = [(x + y) % modulus for x, y in zip(lo, hi)]
+                a[start + m : start + step] = [
+                    (x - y) % modulus for x, y in zip(lo, hi)
+                ]
+        m = step
+    if size == 1:
+        a[0] %= modulus
+    return a
+
+
+def _powers(x: int, count: int) -> list[int]:
+    o = [1]
+    for _ in range(count - 1):
+        o.append(o[-1] * x % MODULUS)
+    return o
+
+
+def _as_int(x) -> int:
+    assert isinstance(x, (Scalar, int))
+    return int(x)
+
+
+class PeriodicEvaluations:
+    """Evaluations over a domain that repeat with a short period, stored as a
+    single period together with its inverses, so that dividing a polynomial
+    by them costs one multiplication per element and no inversions. Used for
+    the vanishing polynomial over the extended coset, which takes only 4
+    distinct values there."""
+
+    __slots__ = ("values", "inverses")
+
+    values: list[int]
+    inverses: list[int]
+
+    def __init__(self, values: list[int]):
+        self.values = values
+        self.inverses = batch_inverse(values)
+
+    def __len__(self):
+        return len(self.values)
+
+
 class Polynomial:
-    values: list[Scalar]
+    """A polynomial, given either by its evaluations at the roots of unity
+    (Basis.LAGRANGE) or by its coefficients (Basis.MONOMIAL).
+
+    The values are stored as plain ints, so that pointwise arithmetic does not
+    allocate a Scalar per element. Additions and subtractions leave them
+    unreduced (any int congruent to the value mod the field modulus);
+    they are reduced by multiplications, and whenever they are handed out
+    through `values` or `ints`."""
+
+    __slots__ = ("_values", "_reduced", "_monomial", "basis")
+
     basis: Basis
 
     def __init__(self, values: list[Scalar], basis: Basis):
         assert all(isinstance(x, Scalar) for x in values)
         assert isinstance(basis, Basis)
-        self.values = values
+        self._values = [x.n for x in values]
+        self._reduced = True
+        self._monomial = None
         self.basis = basis
 
+    # Builds a polynomial straight from ints, without per-element checks
+    @classmethod
+    def from_ints(cls, values: list[int], basis: Basis, reduced=False):
+        o = cls.__new__(cls)
+        o._values = values
+        o._reduced = reduced
+        o._monomial = None
+        o.basis = basis
+        return o
+
+    # The values as reduced ints. The returned list must not be modified
+    @property
+    def ints(self) -> list[int]:
+        if not self._reduced:
+            self._values = [x % MODULUS for x in self._values]
+            self._reduced = True
+        return self._values
+
+    @property
+    def values(self) -> list[Scalar]:
+        return [Scalar(x) for x in self.ints]
+
+    def __len__(self):
+        return len(self._values)
+
     def __eq__(self, other):
-        return (self.basis == other.basis) and (self.values == other.values)
+        return (self.basis == other.basis) and (self.ints == other.ints)
 
     def __add__(self, other):
         if isinstance(other, Polynomial):
-            assert len(self.values) == len(other.values)
+            assert len(self) == len(other)
             assert self.basis == other.basis
 
-            return Polynomial(
-                [x + y for x, y in zip(self.values, other.values)],
+            return Polynomial.from_ints(
+                [x + y for x, y in zip(self._values, other._values)],
                 self.basis,
             )
         else:
-            assert isinstance(other, Scalar)
+            other = _as_int(other)
             if self.basis == Basis.LAGRANGE:
-                return Polynomial(
-                    [x + other for x in self.values],
+                return Polynomial.from_ints(
+                    [x + other for x in self._values],
                     self.basis,
                 )
             else:
-                return Polynomial(
-                    [self.values[0] + other] + self.values[1:],
-                    self.basis
+                return Polynomial.from_ints(
+                    [self._values[0] + other] + self._values[1:],
+                    self.basis,
                 )
 
     def __sub__(self, other):
         if isinstance(other, Polynomial):
-            assert len(self.values) == len(other.values)
+            assert len(self) == len(other)
             assert self.basis == other.basis
 
-            return Polynomial(
-                [x - y for x, y in zip(self.values, other.values)],
+            return Polynomial.from_ints(
+                [x - y for x, y in zip(self._values, other._values)],
                 self.basis,
             )
         else:
-            assert isinstance(other, Scalar)
+            other = _as_int(other)
             if self.basis == Basis.LAGRANGE:
-                return Polynomial(
-                    [x - other for x in self.values],
+                return Polynomial.from_ints(
+                    [x - other for x in self._values],
                     self.basis,
                 )
             else:
-                return Polynomial(
-                    [self.values[0] - other] + self.values[1:],
-                    self.basis
+                return Polynomial.from_ints(
+                    [self._values[0] - other] + self._values[1:],
+                    self.basis,
                 )
 
-
     def __mul__(self, other):
         if isinstance(other, Polynomial):
             assert self.basis == Basis.LAGRANGE
             assert self.basis == other.basis
-            assert len(self.values) == len(other.values)
+            assert len(self) == len(other)
 
-            return Polynomial(
-                [x * y for x, y in zip(self.values, other.values)],
+            return Polynomial.from_ints(
+                [x * y % MODULUS for x, y in zip(self._values, other._values)],
                 self.basis,
+                reduced=True,
             )
         else:
-            assert isinstance(other, Scalar)
-            return Polynomial(
-                [x * other for x in self.values],
+            other = _as_int(other)
+            return Polynomial.from_ints(
+                [x * other % MODULUS for x in self._values],
                 self.basis,
+                reduced=True,
             )
 
     def __truediv__(self, other):
-        if isinstance(other, Polynomial):
+        if isinstance(other, PeriodicEvaluations):
+            assert self.basis == Basis.LAGRANGE
+            assert len(self) % len(other) == 0
+
+            inverses = other.inverses * (len(self) // len(other))
+            return Polynomial.from_ints(
+                [x * y_inv % MODULUS for x, y_inv in zip(self._values, inverses)],
+                self.basis,
+                reduced=True,
+            )
+        elif isinstance(other, Polynomial):
             assert self.basis == Basis.LAGRANGE
             assert self.basis == other.basis
-            assert len(self.values) == len(other.values)
+            assert len(self) == len(other)
 
-            return Polynomial(
-                [x / y for x, y in zip(self.values, other.values)],
+            return Polynomial.from_ints(
+                [
+                    x * y_inv % MODULUS
+                    for x, y_inv in zip(self._values, batch_inverse(other._values))
+                ],
                 self.basis,
+                reduced=True,
             )
         else:
-            assert isinstance(other, Scalar)
-            return Polynomial(
-                [x / other for x in self.values],
+            inv_other = pow(_as_int(other), -1, MODULUS)
+            return Polynomial.from_ints(
+                [x * inv_other % MODULUS for x in self._values],
                 self.basis,
+                reduced=True,
             )
 
+    # Computes `constant + sum(poly * coeff for poly, coeff in terms)` in a single
+    # pass over the evaluations, with one modular reduction per element, rather
+    # than allocating and reducing a temporary polynomial for every operator
+    @classmethod
+    def linear_combination(cls, terms: list[tuple["Polynomial", Scalar]], constant=0):
+        polys = [poly for poly, _ in terms]
+        coeffs = [_as_int(coeff) for _, coeff in terms]
+        basis = polys[0].basis
+        assert all(poly.basis == basis for poly in polys)
+        assert all(len(poly) == len(polys[0]) for poly in polys)
+        constant = _as_int(constant)
+
+        o = [
+            sum(map(mul, column, coeffs)) % MODULUS
+            for column in zip(*[poly._values for poly in polys])
+        ]
+        if basis == Basis.LAGRANGE:
+            o = [(x + constant) % MODULUS for x in o] if constant else o
+        else:
+            o[0] = (o[0] + constant) % MODULUS
+        return cls.from_ints(o, basis, reduced=True)
+
     def shift(self, shift: int):
         assert self.basis == Basis.LAGRANGE
-        assert shift < len(self.values)
+        assert shift < len(self)
 
-        return Polynomial(
-            self.values[shift:] + self.values[:shift],
+        return Polynomial.from_ints(
+            self._values[shift:] + self._values[:shift],
             self.basis,
+            self._reduced,
         )
 
     # Convenience method to do FFTs specifically over the subgroup over which
@@ -113,35 +549,23 @@ class Polynomial:
     def fft(self, inv=False):
         # Fast Fourier transform, used to convert between polynomial coefficients
         # and a list of evaluations at the roots of unity
-        # See https://vitalik.ca/general/2019/05/12/fft.html
-        def _fft(vals, modulus, roots_of_unity):
-            if len(vals) == 1:
-                return vals
-            L = _fft(vals[::2], modulus, roots_of_unity[::2])
-            R = _fft(vals[1::2], modulus, roots_of_unity[::2])
-            o = [0] * len(vals)
-            for i, (x, y) in enumerate(zip(L, R)):
-                y_times_root = y * roots_of_unity[i]
-                o[i] = (x + y_times_root) % modulus
-                o[i + len(L)] = (x - y_times_root) % modulus
-            return o
-
-        roots = [x.n for x in Scalar.roots_of_unity(len(self.values))]
-        o, nvals = Scalar.field_modulus, [x.n for x in self.values]
+        # See https://vitalik.ca/general/2019/05/12/fft.html and
+        # EvaluationDomain.fft
+        domain = EvaluationDomain.get(len(self))
         if inv:
             assert self.basis == Basis.LAGRANGE
-            # Inverse FFT
-            invlen = Scalar(1) / len(self.values)
-            reversed_roots = [roots[0]] + roots[1:][::-1]
-            return Polynomial(
-                [Scalar(x) * invlen for x in _fft(nvals, o, reversed_roots)],
-                Basis.MONOMIAL,
-            )
+            # Inverse FFT. Polynomials are never modified in place, so the
+            # result is kept and reused by later calls
+            if self._monomial is None:
+                self._monomial = Polynomial.from_ints(
+                    domain.ifft(self._values), Basis.MONOMIAL, reduced=True
+                )
+            return self._monomial
         else:
             assert self.basis == Basis.MONOMIAL
             # Regular FFT
-            return Polynomial(
-                [Scalar(x) for x in _fft(nvals, o, roots)], Basis.LAGRANGE
+            return Polynomial.from_ints(
+                domain.fft(self._values), Basis.LAGRANGE, reduced=True
             )
 
     def ifft(self):
@@ -155,12 +579,10 @@ class Polynomial:
     # chosen randomly)
     def to_coset_extended_lagrange(self, offset):
         assert self.basis == Basis.LAGRANGE
-        group_order = len(self.values)
-        x_powers = self.ifft().values
-        x_powers = [(offset**i * x) for i, x in enumerate(x_powers)] + [Scalar(0)] * (
-            group_order * 3
+        domain = EvaluationDomain.get(len(self) * 4, offset)
+        return Polynomial.from_ints(
+            domain.extend(self.ifft()._values), Basis.LAGRANGE, reduced=True
         )
-        return Polynomial(x_powers, Basis.MONOMIAL).fft()
 
     # Convert from offset form into coefficients
     # Note that we can't make a full inverse function of to_coset_extended_lagrange
@@ -169,27 +591,49 @@ class Polynomial:
     def coset_extended_lagrange_to_coeffs(self, offset):
         assert self.basis == Basis.LAGRANGE
 
-        shifted_coeffs = self.ifft().values
-        inv_offset = 1 / offset
-        return Polynomial(
-            [v * inv_offset**i for (i, v) in enumerate(shifted_coeffs)],
+        shifted_coeffs = self.ifft()._values
+        inv_offset_powers = EvaluationDomain.get(
+            len(shifted_coeffs), offset
+        ).offset_inv_powers
+        return Polynomial.from_ints(
+            [
+                v * inv_power % MODULUS
+                for v, inv_power in zip(shifted_coeffs, inv_offset_powers)
+            ],
             Basis.MONOMIAL,
+            reduced=True,
         )
 
     # Given a polynomial expressed as a list of evaluations at roots of unity,
     # evaluate it at x directly, without using an FFT to covert to coeffs first
     def barycentric_eval(self, x: Scalar):
-        assert self.basis == Basis.LAGRANGE
+        return Polynomial.barycentric_eval_many([self], x)[0]
 
-        order = len(self.values)
-        roots_of_unity = Scalar.roots_of_unity(order)
-        return (
-            (Scalar(x) ** order - 1)
-            / order
-            * sum(
-                [
-                    value * root / (x - root)
-                    for value, root in zip(self.values, roots_of_unity)
-                ]
-            )
-        )
+    # Evaluates several polynomials, all given as evaluations at the same roots
+    # of unity, at the same point x. The barycentric weights are shared (and
+    # cached), so each polynomial only costs a dot product
+    @classmethod
+    def barycentric_eval_many(cls, polys: list["Polynomial"], x: Scalar):
+        assert all(poly.basis == Basis.LAGRANGE for poly in polys)
+        order = len(polys[0])
+        assert all(len(poly) == order for poly in polys)
+
+        weights = EvaluationDomain.get(order).barycentric_weights(_as_int(x))
+        return [
+            Scalar(sum(map(mul, poly._values, weights)) % MODULUS) for poly in polys
+        ]
+
+
+# The running products of numerators[i] / denominators[i], as used by
+# accumulators such as the permutation argument's Z (or a lookup argument's):
+# [1, n_0 / d_0, n_0 * n_1 / (d_0 * d_1), ...], of length len(numerators) + 1.
+# All the denominators are inverted at once (see batch_inverse), so this costs
+# a single modular inversion and a few multiplications per element
+def grand_product(numerators: list[int], denominators: list[int]) -> list[int]:
+    assert len(numerators) == len(denominators)
+    o = [1]
+    acc = 1
+    for numerator, denominator_inv in zip(numerators, batch_inverse(denominators)):
+        acc = acc * numerator % MODULUS * denominator_inv % MODULUS
+        o.append(acc)
+    return o
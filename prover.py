@@ -1,10 +1,13 @@
 from compiler.program import Program, CommonPreprocessedInput
+from compiler.utils import Column
 from utils import *
 from setup import *
-from typing import Optional
+from typing import Optional, Union
 from dataclasses import dataclass
+from enum import Enum
 from transcript import Transcript, Message1, Message2, Message3, Message4, Message5
-from poly import Polynomial, Basis
+from poly import Polynomial, Basis, EvaluationDomain, MODULUS, grand_product
+from curve import primitive_root
 
 
 @dataclass
@@ -35,28 +38,73 @@ class Proof:
         return proof
 
 
+class CheckLevel(Enum):
+    # No self-checks at all, for production use
+    OFF = 0
+    # Only checks on values that are computed anyway, plus the check that the
+    # witness satisfies the gates, which catches bad witnesses early
+    CHEAP = 1
+    # Also re-verifies Z row by row and re-evaluates T1, T2, T3 and R, to
+    # cross-check the prover's own arithmetic. Meant for tests and CI
+    PARANOID = 2
+
+
 @dataclass
 class Prover:
     group_order: int
     setup: Setup
     program: Program
     pk: CommonPreprocessedInput
-
-    def __init__(self, setup: Setup, program: Program):
+    checks: CheckLevel
+    # (id(polynomial), offset) -> (polynomial, its coset extended evaluations)
+    expansions: dict[tuple[int, int], tuple[Polynomial, Polynomial]]
+
+    # With fixed_coset, the quotient is computed over the fixed coset generated by
+    # the primitive root, so the expansions of the circuit polynomials are
+    # computed once here and reused by every proof. Proofs must then be
+    # verified with a verification key made from `self.pk`.
+    # `checks` sets how much the prover checks its own intermediate results
+    def __init__(
+        self,
+        setup: Setup,
+        program: Program,
+        fixed_coset: bool = False,
+        checks: CheckLevel = CheckLevel.CHEAP,
+    ):
         self.group_order = program.group_order
         self.setup = setup
         self.program = program
-        self.pk = program.common_preprocessed_input()
-
-    def prove(self, witness: dict[Optional[str], int]) -> Proof:
+        self.checks = checks
+        self.pk = program.common_preprocessed_input(fixed_coset)
+        self.expansions = {}
+
+    # The witness is either {variable name: value}, or a dense list indexed by
+    # variable id, as made by Program.dense_witness
+    def prove(self, witness: Union[dict[Optional[str], int], list[int]]) -> Proof:
+        # Coset expansions are memoized for the duration of a single proof (see
+        # fft_expand), and dropped once it is done. The precomputed expansions
+        # of the circuit polynomials, if any, are seeded into the same cache
+        if self.pk.fixed_coset:
+            assert self.pk.coset_expansions is not None
+            for name, expansion in self.pk.coset_expansions.items():
+                poly = getattr(self.pk, name)
+                self.expansions[(id(poly), primitive_root)] = (poly, expansion)
+        try:
+            return self._prove(witness)
+        finally:
+            self.expansions.clear()
+
+    def _prove(self, witness: Union[dict[Optional[str], int], list[int]]) -> Proof:
         # Initialise Fiat-Shamir transcript
         transcript = Transcript(b"plonk")
 
         # Collect fixed and public information
         # FIXME: Hash pk and PI into transcript
+        if isinstance(witness, dict):
+            witness = self.program.dense_witness(witness)
         public_vars = self.program.get_public_assignments()
         PI = Polynomial(
-            [Scalar(-witness[v]) for v in public_vars]
+            [Scalar(-witness[self.program.variable_ids[v]]) for v in public_vars]
             + [Scalar(0) for _ in range(self.group_order - len(public_vars))],
             Basis.LAGRANGE,
         )
@@ -68,7 +116,7 @@ class Prover:
 
         # Round 2
         msg_2 = self.round_2()
-        self.alpha, self.fft_cofactor = transcript.round_2(msg_2)
+        self.alpha, self.fft_cofactor = transcript.round_2(msg_2, self.pk.fixed_coset)
 
         # Round 3
         msg_3 = self.round_3()
@@ -83,62 +131,31 @@ class Prover:
 
         return Proof(msg_1, msg_2, msg_3, msg_4, msg_5)
 
-    def round_1(
-        self,
-        witness: dict[Optional[str], int],
-    ) -> Message1:
+    def round_1(self, witness: list[int]) -> Message1:
         program = self.program
         setup = self.setup
         group_order = self.group_order
 
-        if None not in witness:
-            witness[None] = 0
-
-        # Compute wire assignments for A, B, C, corresponding:
-        # - A_values: witness[program.wires()[i].L]
-        # - B_values: witness[program.wires()[i].R]
-        # - C_values: witness[program.wires()[i].O]
-
-        a = program.wires()
-
+        # Compute wire assignments for A, B, C: the witness is dense, and the
+        # program has already compiled its wires into variable ids, so each
+        # column is a single gather. Padding rows use variable id 0 (None),
+        # which is always 0
+        #
         # Input Values:
         # witness: {None: 0, 'a': 3, 'b': 4, 'c': 12, 'd': 5, 'e': 60}
         # program.wires(): [Wire(L='e', R=None, O=None),
         #                   Wire(L='a', R='b', O='c'),
         #                   Wire(L='c', R='d', O='e')]
-        # A_values: [60, 3, 12]
-        # B_values: [None, 4, 5]
-        # C_values: [None, 12, 60]
-
-        print("program.wires():", program.wires())
-
-        A_values = [
-            Scalar(witness[program.wires()[i].L])
-            for i in range(len(program.constraints))
-        ]
-        B_values = [
-            Scalar(witness[program.wires()[i].R])
-            for i in range(len(program.constraints))
-        ]
-        C_values = [
-            Scalar(witness[program.wires()[i].O])
-            for i in range(len(program.constraints))
-        ]
+        # A_values: [60, 3, 12, 0, 0, 0, 0, 0]
+        # B_values: [0, 4, 5, 0, 0, 0, 0, 0]
+        # C_values: [0, 12, 60, 0, 0, 0, 0, 0]
+        values = program.wire_values(witness)
 
         # Construct A, B, C Lagrange interpolation polynomials for
         # A_values, B_values, C_values
-
-        # group_order = 8 and program.constraints = 3, so padding with 5 0s
-        # Padding with 0s to make the polynomials the same length as the group order
-        padding = [Scalar(0)] * (group_order - len(program.constraints))
-
-        list_a = A_values + padding
-        list_b = B_values + padding
-        list_c = C_values + padding
-
-        self.A = Polynomial(list_a, Basis.LAGRANGE)
-        self.B = Polynomial(list_b, Basis.LAGRANGE)
-        self.C = Polynomial(list_c, Basis.LAGRANGE)
+        self.A = Polynomial.from_ints(values[Column.LEFT], Basis.LAGRANGE, True)
+        self.B = Polynomial.from_ints(values[Column.RIGHT], Basis.LAGRANGE, True)
+        self.C = Polynomial.from_ints(values[Column.OUTPUT], Basis.LAGRANGE, True)
 
         # Compute a_1, b_1, c_1 commitments to A, B, C polynomials
         a_1 = setup.commit(self.A)
@@ -153,15 +170,16 @@ class Prover:
         # self.pk.QC = [0, 0, 0, 0, 0, 0, 0, 0]
 
         # Sanity check that witness fulfils gate constraints
-        assert (
-            self.A * self.pk.QL
-            + self.B * self.pk.QR
-            + self.A * self.B * self.pk.QM
-            + self.C * self.pk.QO
-            + self.PI
-            + self.pk.QC
-            == Polynomial([Scalar(0)] * group_order, Basis.LAGRANGE)
-        )
+        if self.checks != CheckLevel.OFF:
+            assert (
+                self.A * self.pk.QL
+                + self.B * self.pk.QR
+                + self.A * self.B * self.pk.QM
+                + self.C * self.pk.QO
+                + self.PI
+                + self.pk.QC
+                == Polynomial([Scalar(0)] * group_order, Basis.LAGRANGE)
+            )
 
         # Return a_1, b_1, c_1
         return Message1(a_1, b_1, c_1)
@@ -183,50 +201,67 @@ class Prover:
         # connecting all the gates constraints.
         # Z(X) will be used in later rounds to verify copy constraints.
 
-        roots_of_unity = Scalar.roots_of_unity(group_order)
-
-        # First term of Z is 1
-        Z_values = [Scalar(1)]
-
-        for i in range(group_order):
-
-            # numerator is the RLC of A, B, C with respect to the roots of unity
-            # k_1 and k_2 are the powers of the roots of unity and we multiply
-            # B & C so that their domains do not overlap
-            # In implementation, k_1 = 2, k_2 = 3
-            numerator = (
-                self.rlc(self.A.values[i], roots_of_unity[i])
-                * self.rlc(self.B.values[i], 2 * roots_of_unity[i])
-                * self.rlc(self.C.values[i], 3 * roots_of_unity[i])
+        roots_of_unity = EvaluationDomain.get(group_order).roots
+        beta, gamma = self.beta.n, self.gamma.n
+
+        # numerator is the RLC of A, B, C with respect to the roots of unity
+        # k_1 and k_2 are the powers of the roots of unity and we multiply
+        # B & C so that their domains do not overlap
+        # In implementation, k_1 = 2, k_2 = 3
+        # denominator is the RLC of A, B, C with respect to the selector polynomials
+        numerators = []
+        denominators = []
+        for a, b, c, s1, s2, s3, root in zip(
+            self.A.ints,
+            self.B.ints,
+            self.C.ints,
+            self.pk.S1.ints,
+            self.pk.S2.ints,
+            self.pk.S3.ints,
+            roots_of_unity,
+        ):
+            beta_root = beta * root
+            numerators.append(
+                (a + beta_root + gamma)
+                * (b + 2 * beta_root + gamma)
+                % MODULUS
+                * (c + 3 * beta_root + gamma)
+                % MODULUS
             )
-
-            # denominator is the RLC of A, B, C with respect to the selector polynomials
-            denominator = (
-                self.rlc(self.A.values[i], self.pk.S1.values[i])
-                * self.rlc(self.B.values[i], self.pk.S2.values[i])
-                * self.rlc(self.C.values[i], self.pk.S3.values[i])
+            denominators.append(
+                (a + beta * s1 + gamma)
+                * (b + beta * s2 + gamma)
+                % MODULUS
+                * (c + beta * s3 + gamma)
+                % MODULUS
             )
 
-            # Z_i = Z_{i-1} * (numerator / denominator)
-            Z_values.append(Z_values[-1] * (numerator / denominator))
+        # Z_i = Z_{i-1} * (numerator / denominator), and the first term of Z is 1
+        Z_values = [Scalar(x) for x in grand_product(numerators, denominators)]
 
         # Check that the last term Z_n = 1
         # When the copy constraint is satisfied, Z_n = 1
-        assert Z_values.pop() == 1
+        Z_n = Z_values.pop()
+        if self.checks != CheckLevel.OFF:
+            assert Z_n == 1
 
         # Sanity-check that Z was computed correctly
-        for i in range(group_order):
-            assert (
-                self.rlc(self.A.values[i], roots_of_unity[i])
-                * self.rlc(self.B.values[i], 2 * roots_of_unity[i])
-                * self.rlc(self.C.values[i], 3 * roots_of_unity[i])
-            ) * Z_values[i] - (
-                self.rlc(self.A.values[i], self.pk.S1.values[i])
-                * self.rlc(self.B.values[i], self.pk.S2.values[i])
-                * self.rlc(self.C.values[i], self.pk.S3.values[i])
-            ) * Z_values[
-                (i + 1) % group_order
-            ] == 0
+        if self.checks == CheckLevel.PARANOID:
+            A_values, B_values, C_values = self.A.values, self.B.values, self.C.values
+            S1_values, S2_values = self.pk.S1.values, self.pk.S2.values
+            S3_values = self.pk.S3.values
+            for i in range(group_order):
+                assert (
+                    self.rlc(A_values[i], roots_of_unity[i])
+                    * self.rlc(B_values[i], 2 * roots_of_unity[i])
+                    * self.rlc(C_values[i], 3 * roots_of_unity[i])
+                ) * Z_values[i] - (
+                    self.rlc(A_values[i], S1_values[i])
+                    * self.rlc(B_values[i], S2_values[i])
+                    * self.rlc(C_values[i], S3_values[i])
+                ) * Z_values[
+                    (i + 1) % group_order
+                ] == 0
 
         # Construct Z, Lagrange interpolation polynomial for Z_values
         self.Z = Polynomial(Z_values, Basis.LAGRANGE)
@@ -243,19 +278,42 @@ class Prover:
 
         # Compute the quotient polynomial
 
-        # List of roots of unity at 4x fineness, i.e. the powers of µ
-        # where µ^(4n) = 1
-        # t(X) has degree
-        roots_of_unity_by_4 = Scalar.roots_of_unity(4 * group_order)
-        roots_of_unity_by_4_poly = Polynomial(roots_of_unity_by_4, Basis.LAGRANGE)
+        # Roots of unity at 4x fineness, i.e. the powers of µ where µ^(4n) = 1,
+        # shifted by fft_cofactor: this is the coset that the "_big"
+        # polynomials are evaluated over
+        coset_by_4 = EvaluationDomain.get(4 * group_order, self.fft_cofactor)
 
         # Using self.fft_expand, move A, B, C into coset extended Lagrange basis
         A_big = self.fft_expand(self.A)
         B_big = self.fft_expand(self.B)
         C_big = self.fft_expand(self.C)
 
-        # Expand public inputs polynomial PI into coset extended Lagrange
-        PI_big = self.fft_expand(self.PI)
+        # Compute Z_H = X^N - 1, also in evaluation form in the coset. It only
+        # takes 4 distinct values there, so it is kept as those 4 values
+        # with their inverses, and dividing by it is just a multiplication
+        # Z_H(X) (paper)
+        Z_H = coset_by_4.vanishing_evals(group_order)
+        self.Z_H = Z_H
+
+        # Compute L0, the Lagrange basis polynomial that evaluates to 1 at x = 1 = ω^0
+        # and 0 at other roots of unity
+        # L_1(X) (paper)
+        L0 = Polynomial([Scalar(1)] + [Scalar(0)] * (group_order - 1), Basis.LAGRANGE)
+        self.L0 = L0
+
+        # Expand the public inputs polynomial PI and L0 into coset extended
+        # Lagrange basis. Both are nonzero only at a few rows, so evaluate them
+        # in closed form over the coset rather than FFT-expanding them, in one
+        # call that shares the inverses they need
+        # PI(X), L_1(X) expanded (paper)
+        domain = EvaluationDomain.get(group_order)
+        PI_entries = {i: v for i, v in enumerate(self.PI.ints) if v}
+        PI_evals, L0_evals = domain.lagrange_coset_evals(
+            [PI_entries, {0: 1}], coset_by_4
+        )
+        PI_big = Polynomial.from_ints(PI_evals, Basis.LAGRANGE, True)
+        L0_big = Polynomial.from_ints(L0_evals, Basis.LAGRANGE, True)
+        self.L0_big = L0_big
 
         # Expand selector polynomials pk.QL, pk.QR, pk.QM, pk.QO, pk.QC
         # into the coset extended Lagrange basis
@@ -285,27 +343,6 @@ class Prover:
         S2_big = self.fft_expand(self.pk.S2)
         S3_big = self.fft_expand(self.pk.S3)
 
-        # Compute Z_H = X^N - 1, also in evaluation form in the coset
-        # Z_H(X) (paper)
-        Z_H = Polynomial(
-            [((self.fft_cofactor * x) ** group_order - 1) for x in roots_of_unity_by_4],
-            Basis.LAGRANGE,
-        )
-        self.Z_H = Z_H
-
-        # Compute L0, the Lagrange basis polynomial that evaluates to 1 at x = 1 = ω^0
-        # and 0 at other roots of unity
-        # L_1(X) (paper)
-        L0 = Polynomial([Scalar(1)] + [Scalar(0)] * (group_order - 1), Basis.LAGRANGE)
-        self.L0 = L0
-
-        # Expand L0 into the coset extended Lagrange basis
-        # L_1(X) expanded (paper)
-        L0_big = self.fft_expand(
-            Polynomial([Scalar(1)] + [Scalar(0)] * (group_order - 1), Basis.LAGRANGE)
-        )
-        self.L0_big = L0_big
-
         # Compute the quotient polynomial (called T(x) in the paper)
         # It is only possible to construct this polynomial if the following
         # equations are true at all roots of unity {1, w ... w^(n-1)}:
@@ -322,79 +359,90 @@ class Prover:
         #    (Z - 1) * L0 = 0
         #    L0 = Lagrange polynomial, equal at all roots of unity except 1
 
-        t_gate_constraints = (
-            A_big * B_big * QM_big
-            + A_big * QL_big
-            + B_big * QR_big
-            + C_big * QO_big
-            + PI_big
-            + QC_big
-        ) / Z_H
-
-        self.X = roots_of_unity_by_4_poly * self.fft_cofactor
-        self.two_X = roots_of_unity_by_4_poly * (self.fft_cofactor * 2)
-        self.three_X = roots_of_unity_by_4_poly * (self.fft_cofactor * 3)
-
-        t_permutation_grand_product = (
-            (
-                (
-                    self.rlc(A_big, self.X)
-                    * self.rlc(B_big, self.two_X)
-                    * self.rlc(C_big, self.three_X)
-                    * Z_big
-                )
-                - (
-                    self.rlc(A_big, S1_big)
-                    * self.rlc(B_big, S2_big)
-                    * self.rlc(C_big, S3_big)
-                    * Z_shifted_big
-                )
-            )
-            * self.alpha
-            / Z_H
-        )
-
-        t_permutation_1st_row = (
-            (Z_big - Scalar(1)) * L0_big * self.alpha * self.alpha / Z_H
-        )
-
-        QUOT_big = (
-            t_gate_constraints + t_permutation_grand_product + t_permutation_1st_row
-        )
+        # All three terms are computed together in a single pass over the 4n
+        # points, with plain ints, rather than through a temporary polynomial
+        # for every intermediate product:
+        #
+        #    QUOT = (gate + alpha * permutation + alpha**2 * first_row) / Z_H
+        self.X = Polynomial.from_ints(coset_by_4.elements, Basis.LAGRANGE, True)
+
+        modulus = MODULUS
+        beta, gamma, alpha = self.beta.n, self.gamma.n, self.alpha.n
+        alpha_squared = alpha * alpha % modulus
+        quot = []
+        for a, b, c, ql, qr, qm, qo, qc, pi, s1, s2, s3, z, z_shifted, x, l0 in zip(
+            A_big.ints,
+            B_big.ints,
+            C_big.ints,
+            QL_big.ints,
+            QR_big.ints,
+            QM_big.ints,
+            QO_big.ints,
+            QC_big.ints,
+            PI_big.ints,
+            S1_big.ints,
+            S2_big.ints,
+            S3_big.ints,
+            Z_big.ints,
+            Z_shifted_big.ints,
+            self.X.ints,
+            L0_big.ints,
+        ):
+            gate = a * (b * qm + ql) + b * qr + c * qo + pi + qc
+            beta_x = beta * x
+            permutation = (
+                (a + beta_x + gamma)
+                * (b + 2 * beta_x + gamma)
+                % modulus
+                * (c + 3 * beta_x + gamma)
+                * z
+                - (a + beta * s1 + gamma)
+                * (b + beta * s2 + gamma)
+                % modulus
+                * (c + beta * s3 + gamma)
+                * z_shifted
+            ) % modulus
+            first_row = (z - 1) * l0
+            quot.append(gate + alpha * permutation + alpha_squared * first_row)
+        QUOT_big = Polynomial.from_ints(quot, Basis.LAGRANGE) / Z_H
+
+        QUOT_big_coeffs = self.expanded_evals_to_coeffs(QUOT_big).ints
 
         # Sanity check: QUOT has degree < 3n
-        assert (
-            self.expanded_evals_to_coeffs(QUOT_big).values[-group_order:]
-            == [0] * group_order
-        )
+        if self.checks != CheckLevel.OFF:
+            assert QUOT_big_coeffs[-group_order:] == [0] * group_order
         print("Generated the quotient polynomial")
 
         # Split up T into T1, T2 and T3 (needed because T has degree 3n - 4, so is
         # too big for the trusted setup)
 
-        QUOT_big_coeffs = self.expanded_evals_to_coeffs(QUOT_big)
-
         # for coefficients of: d < group_order
-        self.T1 = Polynomial(QUOT_big_coeffs.values[:group_order], Basis.MONOMIAL).fft()
+        self.T1 = Polynomial.from_ints(
+            QUOT_big_coeffs[:group_order], Basis.MONOMIAL
+        ).fft()
 
         # for coefficients of: group_order <= d < 2 * group_order
-        self.T2 = Polynomial(
-            QUOT_big_coeffs.values[group_order : 2 * group_order], Basis.MONOMIAL
+        self.T2 = Polynomial.from_ints(
+            QUOT_big_coeffs[group_order : 2 * group_order], Basis.MONOMIAL
         ).fft()
 
         # for coefficients of: 2 * group_order <= d < 3 * group_order
-        self.T3 = Polynomial(
-            QUOT_big_coeffs.values[2 * group_order : 3 * group_order], Basis.MONOMIAL
+        self.T3 = Polynomial.from_ints(
+            QUOT_big_coeffs[2 * group_order : 3 * group_order], Basis.MONOMIAL
         ).fft()
 
         fft_cofactor = self.fft_cofactor
 
         # Sanity check that we've computed T1, T2, T3 correctly
-        assert (
-            self.T1.barycentric_eval(fft_cofactor)
-            + self.T2.barycentric_eval(fft_cofactor) * fft_cofactor**group_order
-            + self.T3.barycentric_eval(fft_cofactor) * fft_cofactor ** (group_order * 2)
-        ) == QUOT_big.values[0]
+        if self.checks == CheckLevel.PARANOID:
+            T1_eval, T2_eval, T3_eval = Polynomial.barycentric_eval_many(
+                [self.T1, self.T2, self.T3], fft_cofactor
+            )
+            assert (
+                T1_eval
+                + T2_eval * fft_cofactor**group_order
+                + T3_eval * fft_cofactor ** (group_order * 2)
+            ) == QUOT_big.ints[0]
 
         print("Generated T1, T2, T3 polynomials")
 
@@ -409,28 +457,20 @@ class Prover:
     def round_4(self) -> Message4:
         # Compute evaluations to be used in constructing the linearization polynomial.
 
-        # Compute a_eval = A(zeta)
-        a_eval = self.A.barycentric_eval(self.zeta)
+        # Compute a_eval = A(zeta), b_eval = B(zeta), c_eval = C(zeta),
+        # s1_eval = pk.S1(zeta) and s2_eval = pk.S2(zeta). These all share the
+        # same evaluation point, so share the barycentric weights too
+        a_eval, b_eval, c_eval, s1_eval, s2_eval = Polynomial.barycentric_eval_many(
+            [self.A, self.B, self.C, self.pk.S1, self.pk.S2], self.zeta
+        )
         self.a_eval = a_eval
-
-        # Compute b_eval = B(zeta)
-        b_eval = self.B.barycentric_eval(self.zeta)
         self.b_eval = b_eval
-
-        # Compute c_eval = C(zeta)
-        c_eval = self.C.barycentric_eval(self.zeta)
         self.c_eval = c_eval
-
-        # Compute s1_eval = pk.S1(zeta)
-        s1_eval = self.pk.S1.barycentric_eval(self.zeta)
         self.s1_eval = s1_eval
-
-        # Compute s2_eval = pk.S2(zeta)
-        s2_eval = self.pk.S2.barycentric_eval(self.zeta)
         self.s2_eval = s2_eval
 
         # Compute z_shifted_eval = Z(zeta * ω)
-        root_of_unity = Scalar.root_of_unity(self.group_order)
+        root_of_unity = EvaluationDomain.get(self.group_order).generator
         self.root_of_unity = root_of_unity
         z_shifted_eval = self.Z.barycentric_eval(self.zeta * root_of_unity)
         self.z_shifted_eval = z_shifted_eval
@@ -449,32 +489,18 @@ class Prover:
 
         zeta = self.zeta
         # L_1(X) (paper) = L0
-        # L_1(zeta) (paper)
-        L_1_eval = self.L0.barycentric_eval(zeta)
 
         # Evaluate the vanishing polynomial Z_H(X) = X^n - 1 at zeta
         # Z_H_eval = self.Z_H.barycentric_eval(zeta)
         Z_H_eval = zeta**self.group_order - 1
 
-        # Move T1, T2, T3 into the coset extended Lagrange basis
-        T1_big = self.fft_expand(self.T1)
-        T2_big = self.fft_expand(self.T2)
-        T3_big = self.fft_expand(self.T3)
-
-        # Move pk.QL, pk.QR, pk.QM, pk.QO, pk.QC into the coset extended Lagrange basis
-        QL_big = self.fft_expand(self.pk.QL)
-        QR_big = self.fft_expand(self.pk.QR)
-        QM_big = self.fft_expand(self.pk.QM)
-        QO_big = self.fft_expand(self.pk.QO)
-        QC_big = self.fft_expand(self.pk.QC)
-
-        # Move Z into the coset extended Lagrange basis
-        Z_big = self.Z_big
-
-        # Move pk.S3 into the coset extended Lagrange basis
-        S3_big = self.fft_expand(self.pk.S3)
-
-        PI_eval = self.PI.barycentric_eval(zeta)
+        # L_1(zeta) (paper), and PI(zeta), in one closed-form evaluation
+        domain = EvaluationDomain.get(self.group_order)
+        PI_entries = {i: v for i, v in enumerate(self.PI.ints) if v}
+        PI_evals, L_1_evals = domain.lagrange_evals(
+            [PI_entries, {0: 1}], [zeta.n], [Z_H_eval.n]
+        )
+        PI_eval, L_1_eval = Scalar(PI_evals[0]), Scalar(L_1_evals[0])
 
         # Compute the "linearization polynomial" R. This is a clever way to avoid
         # needing to provide evaluations of _all_ the polynomials that we are
@@ -494,79 +520,70 @@ class Prover:
 
         # R(X) captures the relation between all the values committed,
         # namely a_bar, b_bar, c_bar, s1_bar, s2_bar, z_bar_omega.
-        # Note: following doesn't work if Q*_big is after a_eval or b_eval
-        # e.g. self.a_eval * self.b_eval * QM_big gives error.
-        R_gates = (
-            QM_big * self.a_eval * self.b_eval
-            + QL_big * self.a_eval
-            + QR_big * self.b_eval
-            + QO_big * self.c_eval
-            + PI_eval
-            + QC_big
+        # R is linear in the polynomials, and has degree < n, so it is computed
+        # directly in the Lagrange basis as one linear combination of them,
+        # plus a constant:
+        #
+        # R_gates = QM * a_eval * b_eval + QL * a_eval + QR * b_eval
+        #           + QO * c_eval + PI_eval + QC
+        # R_permutation = Z * rlc(a_eval, zeta) * rlc(b_eval, 2 * zeta)
+        #                   * rlc(c_eval, 3 * zeta)
+        #                 - rlc(c_eval, S3) * rlc(a_eval, s1_eval)
+        #                   * rlc(b_eval, s2_eval) * z_shifted_eval
+        # R_permutation_1st_row = (Z - 1) * L_1_eval
+        # R_quotient = T1 + T2 * zeta^n + T3 * zeta^2n
+        #
+        # R = R_gates + alpha * R_permutation + alpha^2 * R_permutation_1st_row
+        #     - Z_H_eval * R_quotient
+        permutation_numerator = (
+            self.rlc(self.a_eval, zeta)
+            * self.rlc(self.b_eval, zeta * 2)
+            * self.rlc(self.c_eval, zeta * 3)
         )
-
-        # transform c_eval to polynomial with group_order * 4 length since it
-        # is used in rlc with S3_big which has the same length
-        c_eval_poly = Polynomial([self.c_eval] * self.group_order * 4, Basis.LAGRANGE)
-
-        R_permutation_big = (
-            # self.alpha
-            # * (
-            Z_big
-            * (
-                self.rlc(self.a_eval, zeta)
-                * self.rlc(self.b_eval, zeta * 2)
-                * self.rlc(self.c_eval, zeta * 3)
-            )
-            - (
-                self.rlc(c_eval_poly, S3_big)
-                * self.rlc(self.a_eval, self.s1_eval)
-                * self.rlc(self.b_eval, self.s2_eval)
-            )
+        permutation_denominator = (
+            self.rlc(self.a_eval, self.s1_eval)
+            * self.rlc(self.b_eval, self.s2_eval)
             * self.z_shifted_eval
         )
-        # )
-
-        R_permutation_1st_row_big = (Z_big - Scalar(1)) * L_1_eval
-
-        R_quotient_polynomial_big = (
-            T1_big
-            + T2_big * zeta**self.group_order
-            + T3_big * zeta ** (2 * self.group_order)
+        alpha = self.alpha
+        zeta_to_n = zeta**self.group_order
+
+        R = Polynomial.linear_combination(
+            [
+                (self.pk.QM, self.a_eval * self.b_eval),
+                (self.pk.QL, self.a_eval),
+                (self.pk.QR, self.b_eval),
+                (self.pk.QO, self.c_eval),
+                (self.pk.QC, Scalar(1)),
+                (self.Z, alpha * permutation_numerator + alpha**2 * L_1_eval),
+                (self.pk.S3, -alpha * self.beta * permutation_denominator),
+                (self.T1, -Z_H_eval),
+                (self.T2, -Z_H_eval * zeta_to_n),
+                (self.T3, -Z_H_eval * zeta_to_n**2),
+            ],
+            PI_eval
+            - alpha * (self.c_eval + self.gamma) * permutation_denominator
+            - alpha**2 * L_1_eval,
         )
 
-        R_big = (
-            R_gates
-            + R_permutation_big * self.alpha
-            + R_permutation_1st_row_big * self.alpha * self.alpha
-            - R_quotient_polynomial_big * Z_H_eval
-        )
-
-        R_coeffs = self.expanded_evals_to_coeffs(R_big).values
-        assert R_coeffs[self.group_order :] == [0] * (self.group_order * 3)
-        R = Polynomial(R_coeffs[: self.group_order], Basis.MONOMIAL).fft()
-
         # Commit to R
         R_1 = self.setup.commit(R)
 
         # Sanity-check R
-        assert R.barycentric_eval(zeta) == 0
+        if self.checks == CheckLevel.PARANOID:
+            assert R.barycentric_eval(zeta) == 0
 
         print("Generated linearization polynomial R")
 
         # Generate proof that W(z) = 0 and that the provided evaluations of
         # A, B, C, S1, S2 are correct
 
-        # Move A, B, C into the coset extended Lagrange basis
-        A_big = self.fft_expand(self.A)
-        B_big = self.fft_expand(self.B)
-        C_big = self.fft_expand(self.C)
+        # The numerators below vanish at the point they are divided at, so the
+        # quotients are polynomials of degree < n, and their values at the
+        # roots of unity are just the pointwise quotients of the values there
+        X = Polynomial.from_ints(domain.roots, Basis.LAGRANGE, True)
 
-        # Move pk.S1, pk.S2 into the coset extended Lagrange basis
-        S1_big = self.fft_expand(self.pk.S1)
-        S2_big = self.fft_expand(self.pk.S2)
-
-        # In the COSET EXTENDED LAGRANGE BASIS,
+        # In the LAGRANGE BASIS,
         # Construct W_Z = (
         #     R
         #   + v * (A - a_eval)
@@ -578,20 +595,23 @@ class Prover:
         # Each of the evaluations of A, B, C, S1, S2 that are used in r(X)
         # are included below as KZG commitments to the values (as field elements)
         v = self.v
-        W_z_big = (
-            R_big
-            + (A_big - self.a_eval) * v
-            + (B_big - self.b_eval) * v**2
-            + (C_big - self.c_eval) * v**3
-            + (S1_big - self.s1_eval) * v**4
-            + (S2_big - self.s2_eval) * v**5
-        ) / (self.X - zeta)
-        W_z_coeffs = self.expanded_evals_to_coeffs(W_z_big).values
-        group_order = self.group_order
-        W_z = Polynomial(W_z_coeffs[:group_order], Basis.MONOMIAL).fft()
-
-        # Check that degree of W_z is not greater than n
-        assert W_z_coeffs[group_order:] == [0] * (group_order * 3)
+        W_z = Polynomial.linear_combination(
+            [
+                (R, Scalar(1)),
+                (self.A, v),
+                (self.B, v**2),
+                (self.C, v**3),
+                (self.pk.S1, v**4),
+                (self.pk.S2, v**5),
+            ],
+            -(
+                self.a_eval * v
+                + self.b_eval * v**2
+                + self.c_eval * v**3
+                + self.s1_eval * v**4
+                + self.s2_eval * v**5
+            ),
+        ) / (X - zeta)
 
         # Compute W_z_1 commitment to W_z
         W_z_1 = setup.commit(W_z)
@@ -604,12 +624,7 @@ class Prover:
 
         # In another words, Z is evaluated at zeta * omega, rather than at zeta
         # like the other terms. Thus Z has to be handled separately.
-        W_zw_big = (Z_big - self.z_shifted_eval) / (self.X - zeta * self.root_of_unity)
-        W_zw_coeffs = self.expanded_evals_to_coeffs(W_zw_big).values
-        W_zw = Polynomial(W_zw_coeffs[:group_order], Basis.MONOMIAL).fft()
-
-        # Check that degree of W_z is not greater than n
-        assert W_zw_coeffs[group_order:] == [0] * (group_order * 3)
+        W_zw = (self.Z - self.z_shifted_eval) / (X - zeta * self.root_of_unity)
 
         # Compute W_z_1 commitment to W_z
         W_zw_1 = setup.commit(W_zw)
@@ -619,8 +634,14 @@ class Prover:
         # Return W_z_1, W_zw_1
         return Message5(W_z_1, W_zw_1)
 
+    # Expansions are keyed by the identity of the polynomial, which is kept
+    # alongside so that its id cannot be reused, and by the coset offset, so
+    # rounds 3 and 5 share the expansions of the same polynomials
     def fft_expand(self, x: Polynomial):
-        return x.to_coset_extended_lagrange(self.fft_cofactor)
+        key = (id(x), int(self.fft_cofactor))
+        if key not in self.expansions:
+            self.expansions[key] = (x, x.to_coset_extended_lagrange(self.fft_cofactor))
+        return self.expansions[key][1]
 
     def expanded_evals_to_coeffs(self, x: Polynomial):
         return x.coset_extended_lagrange_to_coeffs(self.fft_cofactor)
@@ -1,16 +1,31 @@
 from utils import *
 import py_ecc.bn128 as b
-from curve import ec_lincomb, G1Point, G2Point
+from curve import (
+    ec_lincomb,
+    ec_mul,
+    fixed_base_lincomb,
+    fixed_base_tables,
+    G1Point,
+    G2Point,
+)
 from compiler.program import CommonPreprocessedInput
 from verifier import VerificationKey
 from dataclasses import dataclass
-from poly import Polynomial, Basis
+from typing import Optional
+from poly import Polynomial, Basis, EvaluationDomain
+import hashlib
+import os
 
 # Recover the trusted setup from a file in the format used in
 # https://github.com/iden3/snarkjs#7-prepare-phase-2
 SETUP_FILE_G1_STARTPOS = 80
 SETUP_FILE_POWERS_POS = 60
 
+# Fixed-base tables are cached on disk next to the setup file, as
+# "<setup file>.fixed_base_w<window bits>"
+FIXED_BASE_FILE_MAGIC = b"PLONKFB2"
+FIXED_BASE_DEFAULT_WINDOW_BITS = 10
+
 
 @dataclass
 class Setup(object):
@@ -19,9 +34,12 @@ class Setup(object):
     powers_of_x: list[G1Point]
     # [x]₂ = xH, where H is a generator of G_2
     X2: G2Point
+    # Optional fixed-base tables for powers_of_x, see `precompute`
+    power_tables: Optional[list[list[tuple[int, int, int]]]] = None
+    fixed_base_window_bits: int = FIXED_BASE_DEFAULT_WINDOW_BITS
 
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, precompute=False):
         contents = open(filename, "rb").read()
         # Byte 60 gives you the base-2 log of how many powers there are
         powers = 2 ** contents[SETUP_FILE_POWERS_POS]
@@ -60,23 +78,121 @@ class Setup(object):
         print("Extracted G2 side, X^1 point: {}".format(X2))
         # assert b.pairing(b.G2, powers_of_x[1]) == b.pairing(X2, b.G1)
         # print("X^1 points checked consistent")
-        return cls(powers_of_x, X2)
+        setup = cls(powers_of_x, X2)
+        if precompute:
+            setup.precompute(
+                "{}.fixed_base_w{}".format(filename, FIXED_BASE_DEFAULT_WINDOW_BITS)
+            )
+        return setup
+
+    # Opt-in: build fixed-base window tables for every power of x, so that
+    # `commit` only has to do table lookups and additions. If `cache_file` is
+    # given, the tables are loaded from it when it matches this setup, and
+    # written to it otherwise.
+    def precompute(
+        self,
+        cache_file: Optional[str] = None,
+        window_bits: int = FIXED_BASE_DEFAULT_WINDOW_BITS,
+    ):
+        self.fixed_base_window_bits = window_bits
+        if cache_file is not None and os.path.exists(cache_file):
+            tables = self._read_fixed_base_tables(cache_file)
+            if tables is not None:
+                self.power_tables = tables
+                print("Loaded fixed-base tables from {}".format(cache_file))
+                return
+        self.power_tables = fixed_base_tables(self.powers_of_x, window_bits)
+        print("Built fixed-base tables for {} powers".format(len(self.powers_of_x)))
+        if cache_file is not None:
+            self._write_fixed_base_tables(cache_file)
+
+    # The file holds a header (magic, window bits, table count, table length),
+    # a digest of the powers of x and window size that the tables were built
+    # from, a digest of the table data, and then the data itself: the x and y
+    # of every entry of every table
+    def _write_fixed_base_tables(self, cache_file: str):
+        assert self.power_tables is not None
+        table_length = len(self.power_tables[0])
+        data = b"".join(
+            x.to_bytes(32, "little") + y.to_bytes(32, "little")
+            for table in self.power_tables
+            for x, y, _ in table
+        )
+        with open(cache_file, "wb") as f:
+            f.write(FIXED_BASE_FILE_MAGIC)
+            f.write(self.fixed_base_window_bits.to_bytes(4, "little"))
+            f.write(len(self.power_tables).to_bytes(4, "little"))
+            f.write(table_length.to_bytes(4, "little"))
+            f.write(self._fixed_base_source_digest())
+            f.write(hashlib.sha256(data).digest())
+            f.write(data)
+
+    # Returns None if the file was built for a different setup or window size,
+    # or is corrupted
+    def _read_fixed_base_tables(self, cache_file: str):
+        contents = open(cache_file, "rb").read()
+        pos = len(FIXED_BASE_FILE_MAGIC)
+        if contents[:pos] != FIXED_BASE_FILE_MAGIC:
+            return None
+        window_bits, count, table_length = [
+            int.from_bytes(contents[i : i + 4], "little")
+            for i in range(pos, pos + 12, 4)
+        ]
+        pos += 12
+        if window_bits != self.fixed_base_window_bits or count != len(self.powers_of_x):
+            return None
+        if contents[pos : pos + 32] != self._fixed_base_source_digest():
+            return None
+        data_digest = contents[pos + 32 : pos + 64]
+        pos += 64
+        if len(contents) != pos + 64 * count * table_length:
+            return None
+        if hashlib.sha256(contents[pos:]).digest() != data_digest:
+            return None
+        tables = []
+        for _ in range(count):
+            table = []
+            for _ in range(table_length):
+                x = int.from_bytes(contents[pos : pos + 32], "little")
+                y = int.from_bytes(contents[pos + 32 : pos + 64], "little")
+                table.append((x, y, 1))
+                pos += 64
+            tables.append(table)
+        # The data is what was written; as a last sanity check of how it was
+        # built, the first table must start with [1]₁ and end with
+        # 2^(c * (k-1)) * [1]₁
+        pt = self.powers_of_x[0]
+        ends = [pt, ec_mul(pt, 2 ** (window_bits * (table_length - 1)))]
+        if [tables[0][0][:2], tables[0][-1][:2]] != [(p[0].n, p[1].n) for p in ends]:
+            return None
+        return tables
+
+    # Digest of what the fixed-base tables are built from: the window size and
+    # the powers of x
+    def _fixed_base_source_digest(self) -> bytes:
+        h = hashlib.sha256(self.fixed_base_window_bits.to_bytes(4, "little"))
+        for x, y in self.powers_of_x:
+            h.update(x.n.to_bytes(32, "little") + y.n.to_bytes(32, "little"))
+        return h.digest()
 
     # Encodes the KZG commitment that evaluates to the given values in the group
     def commit(self, values: Polynomial) -> G1Point:
         assert values.basis == Basis.LAGRANGE
 
         # Run inverse FFT to convert values from Lagrange basis to monomial basis
-        values = values.ifft()
+        coeffs = values.ifft().ints
 
         # Optional: Check values size does not exceed maximum power setup can handle
-        assert len(values.values) <= len(self.powers_of_x)
+        assert len(coeffs) <= len(self.powers_of_x)
 
         # Compute linear combination of setup with values
-        # return NotImplemented
-        return ec_lincomb(
-            [(self.powers_of_x[i], values.values[i]) for i in range(len(values.values))]
-        )
+        if self.power_tables is not None:
+            return fixed_base_lincomb(
+                self.power_tables[: len(coeffs)],
+                coeffs,
+                self.fixed_base_window_bits,
+            )
+        return ec_lincomb(list(zip(self.powers_of_x, coeffs)))
 
     # Generate the verification key for this program with the given setup
     def verification_key(self, pk: CommonPreprocessedInput) -> VerificationKey:
@@ -93,5 +209,6 @@ class Setup(object):
             S2=self.commit(pk.S2),
             S3=self.commit(pk.S3),
             X_2=self.X2,
-            w=Scalar.root_of_unity(pk.group_order),
+            w=EvaluationDomain.get(pk.group_order).generator,
+            fixed_coset=pk.fixed_coset,
         )
@@ -1,12 +1,16 @@
 import pickle
+import tempfile
 from TESTING_verifier_DO_NOT_OPEN import TestingVerificationKey
 from compiler.program import Program
-from curve import G1Point
+from curve import G1Point, pairing_check
+from py_ecc.bn128 import FQ
 from poly import Basis, Polynomial
 from setup import Setup
-from prover import Prover
+from prover import Prover, CheckLevel
+from transcript import Message5
 from verifier import VerificationKey
 import json
+from dataclasses import replace
 from test.mini_poseidon import rc, mds, poseidon_hash
 from utils import *
 
@@ -34,6 +38,31 @@ def setup_test():
     print("Successfully created dummy commitment and verification key")
 
 
+def fixed_base_setup_test():
+    print("===fixed_base_setup_test===")
+
+    setup = Setup.from_file("test/powersOfTau28_hez_final_11.ptau", precompute=True)
+    dummy_values = Polynomial(
+        list(map(Scalar, [1, 2, 3, 4, 5, 6, 7, 8])), Basis.LAGRANGE
+    )
+    commitment = setup.commit(dummy_values)
+    assert commitment == G1Point(
+        (
+            16120260411117808045030798560855586501988622612038310041007562782458075125622,
+            3125847109934958347271782137825877642397632921923926105820408033549219695465,
+        )
+    )
+    # A cache file with any byte changed is rejected
+    cache_file = "test/powersOfTau28_hez_final_11.ptau.fixed_base_w10"
+    contents = bytearray(open(cache_file, "rb").read())
+    contents[len(contents) // 2] ^= 1
+    with tempfile.NamedTemporaryFile() as corrupted:
+        corrupted.write(contents)
+        corrupted.flush()
+        assert setup._read_fixed_base_tables(corrupted.name) is None
+    print("Successfully created dummy commitment with fixed-base tables")
+
+
 def basic_test():
     print("===basic_test===")
 
@@ -106,7 +135,7 @@ def prover_test_dummy_verifier(setup):
     print("Beginning prover test with test verifier")
     program = Program(["e public", "c <== a * b", "e <== c * d"], 8)
     assignments = {"a": 3, "b": 4, "c": 12, "d": 5, "e": 60}
-    prover = Prover(setup, program)
+    prover = Prover(setup, program, checks=CheckLevel.PARANOID)
     proof = prover.prove(assignments)
 
     print("Beginning test verification")
@@ -139,12 +168,74 @@ def prover_test(setup):
     print("Beginning prover test")
     program = Program(["e public", "c <== a * b", "e <== c * d"], 8)
     assignments = {"a": 3, "b": 4, "c": 12, "d": 5, "e": 60}
-    prover = Prover(setup, program)
+    prover = Prover(setup, program, checks=CheckLevel.PARANOID)
     proof = prover.prove(assignments)
     print("Prover test success")
     return proof
 
 
+def fixed_coset_test(setup):
+    print("===fixed_coset_test===")
+
+    program = Program(["e public", "c <== a * b", "e <== c * d"], 8)
+    prover = Prover(setup, program, fixed_coset=True, checks=CheckLevel.OFF)
+    vk = setup.verification_key(prover.pk)
+    public = [60]
+    # The same prover, with its precomputed coset expansions, proves twice
+    for a, b, d in ((3, 4, 5), (2, 10, 3)):
+        assignments = {"a": a, "b": b, "c": a * b, "d": d, "e": 60}
+        proof = prover.prove(program.dense_witness(assignments))
+        assert vk.verify_proof_unoptimized(8, proof, public)
+        assert vk.verify_proof(8, proof, public)
+    # Even without checks, a witness missing a variable is refused
+    try:
+        prover.prove({"a": 3, "b": 4, "c": 12, "e": 60})
+        assert False, "witness without d accepted"
+    except KeyError:
+        pass
+    print("Fixed coset test success")
+
+
+def batch_verifier_test(setup):
+    print("===batch_verifier_test===")
+
+    program = Program(["e public", "c <== a * b", "e <== c * d"], 8)
+    prover = Prover(setup, program)
+    vk = setup.verification_key(program.common_preprocessed_input())
+    proofs, publics = [], []
+    for a, b, d in ((3, 4, 5), (2, 10, 3), (1, 6, 10), (5, 4, 3)):
+        assignments = {"a": a, "b": b, "c": a * b, "d": d, "e": a * b * d}
+        proofs.append(prover.prove(assignments))
+        publics.append([a * b * d])
+    assert vk.verify_batch(proofs, publics) == [True] * 4
+    prepared_vk = vk.prepare()
+    for proof, public in zip(proofs, publics):
+        assert prepared_vk.verify_proof(8, proof, public)
+    # A proof checked against the wrong public input is singled out
+    publics[2] = [61]
+    assert vk.verify_batch(proofs, publics) == [True, True, False, True]
+    assert prepared_vk.verify_batch(proofs, publics) == [True, True, False, True]
+    # As is a proof with a point that is not on the curve, (0, 2) being on
+    # y^2 = x^3 + 4 instead
+    off_curve = Message5(G1Point((FQ(0), FQ(2))), proofs[1].msg_5.W_zw_1)
+    proofs[1] = replace(proofs[1], msg_5=off_curve)
+    for key in (vk, prepared_vk):
+        try:
+            key.verify_proof(8, proofs[1], publics[1])
+            assert False, "proof with an off-curve point accepted"
+        except AssertionError as e:
+            assert "off-curve" not in str(e)
+    assert prepared_vk.verify_batch(proofs, publics) == [True, False, False, True]
+    # The prepared pairing refuses the off-curve point outright
+    lhs, _ = prepared_vk.pairing_terms(8, proofs[1], publics[1])
+    try:
+        pairing_check([(prepared_vk.X_2_prepared, prepared_vk.lincomb(lhs))])
+        assert False, "off-curve point accepted by the prepared pairing"
+    except ValueError:
+        pass
+    print("Batch verifier test success")
+
+
 def verifier_test_unoptimized(setup, proof):
     print("===verifier_test_unoptimized===")
 
@@ -206,7 +297,7 @@ def factorization_test(setup):
             "qb0": 1,
         }
     )
-    prover = Prover(setup, program)
+    prover = Prover(setup, program, checks=CheckLevel.PARANOID)
     proof = prover.prove(assignments)
     print("Generated proof")
     assert vk.verify_proof(16, proof, public)
@@ -252,7 +343,7 @@ def poseidon_test(setup):
     assignments = program.fill_variable_assignments({"L0": 1, "M0": 2})
     vk = setup.verification_key(program.common_preprocessed_input())
     print("Generated verification key")
-    prover = Prover(setup, program)
+    prover = Prover(setup, program, checks=CheckLevel.PARANOID)
     proof = prover.prove(assignments)
     print("Generated proof")
     assert vk.verify_proof(1024, proof, [1, 2, expected_value])
@@ -262,6 +353,7 @@ def poseidon_test(setup):
 if __name__ == "__main__":
     # Step 1: Pass setup test
     setup_test()
+    fixed_base_setup_test()
 
     setup = basic_test()
 
@@ -279,5 +371,7 @@ if __name__ == "__main__":
     one_public_input_test(setup)
     proof = prover_test(setup)
     verifier_test_full(setup, proof)
+    fixed_coset_test(setup)
+    batch_verifier_test(setup)
     factorization_test(setup)
     poseidon_test(setup)
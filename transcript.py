@@ -1,5 +1,5 @@
 from utils import Scalar
-from curve import G1Point
+from curve import G1Point, primitive_root
 from merlin_transcripts import MerlinTranscript
 from py_ecc.secp256k1.secp256k1 import bytes_to_int
 from dataclasses import dataclass
@@ -85,10 +85,18 @@ class Transcript(MerlinTranscript):
 
         return beta, gamma
 
-    def round_2(self, message: Message2) -> tuple[Scalar, Scalar]:
+    def round_2(
+        self, message: Message2, fixed_coset: bool = False
+    ) -> tuple[Scalar, Scalar]:
         self.append_point(b"z_1", message.z_1)
 
         alpha = self.get_and_append_challenge(b"alpha")
+        # In fixed-coset mode, the coset is always the one generated by the
+        # primitive root, which is in no subgroup of power-of-two order, so
+        # its evaluations are never zero. This lets the prover precompute the
+        # expansions of the circuit polynomials, and no challenge is drawn
+        if fixed_coset:
+            return alpha, Scalar(primitive_root)
         # This value could be anything, it just needs to be unpredictable. Lets us
         # have evaluation forms at cosets to avoid zero evaluations, so we can
         # divide polys without the 0/0 issue
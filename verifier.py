@@ -1,9 +1,10 @@
 import py_ecc.bn128 as b
 from utils import *
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
+import secrets
 from curve import *
 from transcript import Transcript
-from poly import Polynomial, Basis
+from poly import EvaluationDomain
 
 
 @dataclass
@@ -32,12 +33,100 @@ class VerificationKey:
     X_2: G2Point
     # nth root of unity (i.e. ω^1), where n is the program's group order.
     w: Scalar
+    # Whether proofs use the fixed coset rather than drawing fft_cofactor from
+    # the transcript (see CommonPreprocessedInput.fixed_coset)
+    fixed_coset: bool = False
 
     # More optimized version that tries hard to minimize pairings and
     # elliptic curve multiplications, but at the cost of being harder
     # to understand and mixing together a lot of the computations to
     # efficiently batch them
     def verify_proof(self, group_order: int, pf, public=[]) -> bool:
+        lhs, rhs = self.pairing_terms(group_order, pf, public)
+        assert self.check_pairing_terms(lhs, rhs)
+        return True
+
+    # Verifies many proofs against this key at once. Each proof's check is
+    # e(X_2, lhs) == e(G2, rhs), with lhs and rhs linear combinations of G1
+    # points (see pairing_terms); the checks are combined with random weights,
+    # so the whole batch costs one linear combination per side and a single
+    # two-pairing check. A batch that fails is bisected to find the bad proofs.
+    # Returns whether each proof is valid
+    def verify_batch(self, proofs: list, publics: list[list[int]]) -> list[bool]:
+        assert len(proofs) == len(publics)
+        terms: list[
+            Optional[tuple[list[tuple[G1Point, int]], list[tuple[G1Point, int]]]]
+        ] = []
+        for pf, public in zip(proofs, publics):
+            try:
+                terms.append(self.pairing_terms(self.group_order, pf, public))
+            except (AssertionError, ZeroDivisionError):
+                terms.append(None)
+        o = [False] * len(proofs)
+        self._verify_batch_range(terms, 0, len(terms), o)
+        return o
+
+    def _verify_batch_range(self, terms, start: int, end: int, o: list[bool]):
+        if start == end:
+            return
+        if end - start == 1:
+            if terms[start] is not None:
+                o[start] = self.check_pairing_terms(*terms[start])
+            return
+        if all(t is not None for t in terms[start:end]):
+            lhs: list[tuple[G1Point, int]] = []
+            rhs: list[tuple[G1Point, int]] = []
+            for proof_lhs, proof_rhs in terms[start:end]:
+                weight = secrets.randbelow(b.curve_order - 1) + 1
+                lhs.extend((pt, coeff * weight) for pt, coeff in proof_lhs)
+                rhs.extend((pt, coeff * weight) for pt, coeff in proof_rhs)
+            if self.check_pairing_terms(lhs, rhs):
+                for i in range(start, end):
+                    o[i] = True
+                return
+        middle = (start + end) // 2
+        self._verify_batch_range(terms, start, middle, o)
+        self._verify_batch_range(terms, middle, end, o)
+
+    # Checks e(X_2, lhs) == e(G2, rhs), where lhs and rhs are given as
+    # (point, coeff) terms, as a single multi-pairing
+    def check_pairing_terms(self, lhs, rhs) -> bool:
+        X_2, G2 = self.pairing_g2_points()
+        # Points that are not on the curve (from a malformed proof) are rejected
+        # by the pairing with a ValueError, for prepared G2 points too (see
+        # prepared_miller_loop)
+        try:
+            return pairing_check(
+                [
+                    (X_2, self.lincomb(lhs)),
+                    (G2, self.lincomb([(pt, -coeff) for pt, coeff in rhs])),
+                ]
+            )
+        except ValueError:
+            return False
+
+    # The G2 points of the pairing check: X_2 and the generator
+    def pairing_g2_points(self):
+        return self.X_2, b.G2
+
+    # Computes a linear combination of G1 terms. Terms on the same point are
+    # merged first, so that shared points like the ones of the key only appear
+    # once
+    def lincomb(self, terms: list[tuple[G1Point, int]]) -> G1Point:
+        return ec_lincomb(_merge_terms(terms))
+
+    # Precomputes everything that does not depend on the proof, for verifying
+    # many proofs against this key (see PreparedVerificationKey)
+    def prepare(self) -> "PreparedVerificationKey":
+        return PreparedVerificationKey(
+            **{f.name: getattr(self, f.name) for f in fields(VerificationKey)}
+        )
+
+    # Computes the terms of the check e(X_2, lhs) == e(G2, rhs) that a valid
+    # proof satisfies, as lists of (G1 point, coefficient)
+    def pairing_terms(
+        self, group_order: int, pf, public=[]
+    ) -> tuple[list[tuple[G1Point, int]], list[tuple[G1Point, int]]]:
         # 4. Compute challenges
         beta, gamma, alpha, zeta, v, u = self.compute_challenges(pf)
         proof = pf.flatten()
@@ -49,12 +138,13 @@ class VerificationKey:
         L_1_eval = Z_H_eval / (group_order * (zeta - 1))
 
         # 7. Compute public input polynomial evaluation PI(ζ).
-        PI = Polynomial(
-            [Scalar(-x) for x in public]
-            + [Scalar(0) for _ in range(group_order - len(public))],
-            Basis.LAGRANGE,
+        # PI is nonzero only at the public input rows, so evaluate it in closed
+        # form rather than with a full barycentric evaluation
+        PI_eval = Scalar(
+            EvaluationDomain.get(group_order).lagrange_evals(
+                [{i: -int(x) for i, x in enumerate(public)}], [zeta.n], [Z_H_eval.n]
+            )[0][0]
         )
-        PI_eval = PI.barycentric_eval(zeta)
 
         # Compute the constant term of R. This is not literally the degree-0
         # term of the R polynomial; rather, it's the portion of R that can
@@ -72,65 +162,61 @@ class VerificationKey:
 
         # Compute D = (R - r0) + u * Z, and E and F
 
-        # ec_lincomb(point, scalar)
-        D = ec_lincomb(
-            [
-                (self.Qm, proof["a_eval"] * proof["b_eval"]),
-                (self.Ql, proof["a_eval"]),
-                (self.Qr, proof["b_eval"]),
-                (self.Qo, proof["c_eval"]),
-                (self.Qc, 1),
+        # (point, coeff)
+        D = [
+            (self.Qm, proof["a_eval"] * proof["b_eval"]),
+            (self.Ql, proof["a_eval"]),
+            (self.Qr, proof["b_eval"]),
+            (self.Qo, proof["c_eval"]),
+            (self.Qc, 1),
+            (
+                proof["z_1"],
                 (
-                    proof["z_1"],
-                    (
-                        (proof["a_eval"] + beta * zeta + gamma)
-                        * (proof["b_eval"] + beta * 2 * zeta + gamma)
-                        * (proof["c_eval"] + beta * 3 * zeta + gamma)
-                        * alpha
-                        + L_1_eval * alpha**2
-                        + u
-                    ),
+                    (proof["a_eval"] + beta * zeta + gamma)
+                    * (proof["b_eval"] + beta * 2 * zeta + gamma)
+                    * (proof["c_eval"] + beta * 3 * zeta + gamma)
+                    * alpha
+                    + L_1_eval * alpha**2
+                    + u
                 ),
+            ),
+            (
+                self.S3,
                 (
-                    self.S3,
-                    (
-                        -(proof["a_eval"] + beta * proof["s1_eval"] + gamma)
-                        * (proof["b_eval"] + beta * proof["s2_eval"] + gamma)
-                        * alpha
-                        * beta
-                        * proof["z_shifted_eval"]
-                    ),
+                    -(proof["a_eval"] + beta * proof["s1_eval"] + gamma)
+                    * (proof["b_eval"] + beta * proof["s2_eval"] + gamma)
+                    * alpha
+                    * beta
+                    * proof["z_shifted_eval"]
                 ),
-                (proof["t_lo_1"], -Z_H_eval),
-                (proof["t_mid_1"], -Z_H_eval * zeta**group_order),
-                (proof["t_hi_1"], -Z_H_eval * zeta ** (2 * group_order)),
-            ],
-        )
+            ),
+            (proof["t_lo_1"], -Z_H_eval),
+            (proof["t_mid_1"], -Z_H_eval * zeta**group_order),
+            (proof["t_hi_1"], -Z_H_eval * zeta ** (2 * group_order)),
+        ]
 
-        F = ec_lincomb(
-            [
-                (D, 1),
-                (proof["a_1"], v),
-                (proof["b_1"], v**2),
-                (proof["c_1"], v**3),
-                (self.S1, v**4),
-                (self.S2, v**5),
-            ]
-        )
+        F = D + [
+            (proof["a_1"], v),
+            (proof["b_1"], v**2),
+            (proof["c_1"], v**3),
+            (self.S1, v**4),
+            (self.S2, v**5),
+        ]
 
-        # ec_mul(pt, coeff)
-        E = ec_mul(
-            b.G1,
+        E = [
             (
-                -r0
-                + v * proof["a_eval"]
-                + v**2 * proof["b_eval"]
-                + v**3 * proof["c_eval"]
-                + v**4 * proof["s1_eval"]
-                + v**5 * proof["s2_eval"]
-                + u * proof["z_shifted_eval"]
-            ),
-        )
+                b.G1,
+                (
+                    -r0
+                    + v * proof["a_eval"]
+                    + v**2 * proof["b_eval"]
+                    + v**3 * proof["c_eval"]
+                    + v**4 * proof["s1_eval"]
+                    + v**5 * proof["s2_eval"]
+                    + u * proof["z_shifted_eval"]
+                ),
+            )
+        ]
         # Run one pairing check to verify the last two checks.
         # What's going on here is a clever re-arrangement of terms to check
         # the same equations that are being checked in the basic version,
@@ -147,23 +233,26 @@ class VerificationKey:
         #
         # so at this point we can take a random linear combination of the two
         # checks, and verify it with only one pairing.
-        root_of_unity = Scalar.root_of_unity(group_order)
-        assert b.pairing(
-            self.X_2,
-            ec_lincomb([(proof["W_z_1"], 1), (proof["W_zw_1"], u)]),
-        ) == b.pairing(
-            b.G2,
-            ec_lincomb(
-                [
-                    (proof["W_z_1"], zeta),
-                    (proof["W_zw_1"], u * zeta * root_of_unity),
-                    (F, 1),
-                    (E, -1),
-                ]
-            ),
+        #
+        # D, F and E are not computed as points of their own: their terms go
+        # straight into the linear combination for the right hand side
+        root_of_unity = EvaluationDomain.get(group_order).generator
+        lhs: list[tuple[G1Point, Union[int, Scalar]]] = [
+            (proof["W_z_1"], 1),
+            (proof["W_zw_1"], u),
+        ]
+        rhs: list[tuple[G1Point, Scalar]] = (
+            [
+                (proof["W_z_1"], zeta),
+                (proof["W_zw_1"], u * zeta * root_of_unity),
+            ]
+            + F
+            + [(pt, -coeff) for pt, coeff in E]
+        )
+        return (
+            [(pt, int(coeff) % b.curve_order) for pt, coeff in lhs],
+            [(pt, int(coeff) % b.curve_order) for pt, coeff in rhs],
         )
-
-        return True
 
     # Basic, easier-to-understand version of what's going on
     def verify_proof_unoptimized(self, group_order: int, pf, public=[]) -> bool:
@@ -179,12 +268,13 @@ class VerificationKey:
         L_1_eval = Z_H_eval / (group_order * (zeta - 1))
 
         # 7. Compute public input polynomial evaluation PI(ζ).
-        PI = Polynomial(
-            [Scalar(-x) for x in public]
-            + [Scalar(0) for _ in range(group_order - len(public))],
-            Basis.LAGRANGE,
+        # PI is nonzero only at the public input rows, so evaluate it in closed
+        # form rather than with a full barycentric evaluation
+        PI_eval = Scalar(
+            EvaluationDomain.get(group_order).lagrange_evals(
+                [{i: -int(x) for i, x in enumerate(public)}], [zeta.n], [Z_H_eval.n]
+            )[0][0]
         )
-        PI_eval = PI.barycentric_eval(zeta)
 
         # Recover the commitment to the linearization polynomial R,
         # exactly the same as what was created by the prover
@@ -245,51 +335,46 @@ class VerificationKey:
         )
 
         # Verify that R(z) = 0 and the prover-provided evaluations
-        # A(z), B(z), C(z), S1(z), S2(z) are all correct\
-        lhs = b.pairing(
-            b.G2,
-            ec_lincomb(
-                [
-                    (R_eval, 1),
-                    (proof["a_1"], v),
-                    (b.G1, -v * proof["a_eval"]),
-                    (proof["b_1"], v**2),
-                    (b.G1, -(v**2) * proof["b_eval"]),
-                    (proof["c_1"], v**3),
-                    (b.G1, -(v**3) * proof["c_eval"]),
-                    (self.S1, v**4),
-                    (b.G1, -(v**4) * proof["s1_eval"]),
-                    (self.S2, v**5),
-                    (b.G1, -(v**5) * proof["s2_eval"]),
-                ]
-            ),
+        # A(z), B(z), C(z), S1(z), S2(z) are all correct, that is
+        # e(G2, R + sum(v^i * (x_i - x_i_eval))) == e(X_2 - zeta * G2, W_z),
+        # as the multi-pairing e(G2, ...) * e(X_2 - zeta * G2, -W_z) == 1
+        assert pairing_check(
+            [
+                (
+                    b.G2,
+                    ec_lincomb(
+                        [
+                            (R_eval, 1),
+                            (proof["a_1"], v),
+                            (b.G1, -v * proof["a_eval"]),
+                            (proof["b_1"], v**2),
+                            (b.G1, -(v**2) * proof["b_eval"]),
+                            (proof["c_1"], v**3),
+                            (b.G1, -(v**3) * proof["c_eval"]),
+                            (self.S1, v**4),
+                            (b.G1, -(v**4) * proof["s1_eval"]),
+                            (self.S2, v**5),
+                            (b.G1, -(v**5) * proof["s2_eval"]),
+                        ]
+                    ),
+                ),
+                (b.add(self.X_2, ec_mul(b.G2, -zeta)), b.neg(proof["W_z_1"])),
+            ]
         )
-        rhs = b.pairing(b.add(self.X_2, ec_mul(b.G2, -zeta)), proof["W_z_1"])
-        assert b.pairing(
-            b.G2,
-            ec_lincomb(
-                [
-                    (R_eval, 1),
-                    (proof["a_1"], v),
-                    (b.G1, -v * proof["a_eval"]),
-                    (proof["b_1"], v**2),
-                    (b.G1, -(v**2) * proof["b_eval"]),
-                    (proof["c_1"], v**3),
-                    (b.G1, -(v**3) * proof["c_eval"]),
-                    (self.S1, v**4),
-                    (b.G1, -(v**4) * proof["s1_eval"]),
-                    (self.S2, v**5),
-                    (b.G1, -(v**5) * proof["s2_eval"]),
-                ]
-            ),
-        ) == b.pairing(b.add(self.X_2, ec_mul(b.G2, -zeta)), proof["W_z_1"])
 
         # Verify that the provided value of Z(zeta*w) is correct
-        root_of_unity = Scalar.root_of_unity(group_order)
-        assert b.pairing(
-            b.G2, ec_lincomb([(proof["z_1"], 1), (b.G1, -proof["z_shifted_eval"])])
-        ) == b.pairing(
-            b.add(self.X_2, ec_mul(b.G2, -zeta * root_of_unity)), proof["W_zw_1"]
+        root_of_unity = EvaluationDomain.get(group_order).generator
+        assert pairing_check(
+            [
+                (
+                    b.G2,
+                    ec_lincomb([(proof["z_1"], 1), (b.G1, -proof["z_shifted_eval"])]),
+                ),
+                (
+                    b.add(self.X_2, ec_mul(b.G2, -zeta * root_of_unity)),
+                    b.neg(proof["W_zw_1"]),
+                ),
+            ]
         )
         return True
 
@@ -299,9 +384,85 @@ class VerificationKey:
     ) -> tuple[Scalar, Scalar, Scalar, Scalar, Scalar, Scalar]:
         transcript = Transcript(b"plonk")
         beta, gamma = transcript.round_1(proof.msg_1)
-        alpha, _fft_cofactor = transcript.round_2(proof.msg_2)
+        alpha, _fft_cofactor = transcript.round_2(proof.msg_2, self.fixed_coset)
         zeta = transcript.round_3(proof.msg_3)
         v = transcript.round_4(proof.msg_4)
         u = transcript.round_5(proof.msg_5)
 
         return beta, gamma, alpha, zeta, v, u
+
+
+# Window size of the fixed-base tables of a PreparedVerificationKey. Each
+# table is only used for a single scalar per linear combination, so small
+# windows, with few buckets to sum up, are best
+PREPARED_WINDOW_BITS = 4
+
+
+@dataclass
+class PreparedVerificationKey(VerificationKey):
+    """A verification key with everything that does not depend on the proof
+    precomputed, for verifying many proofs against the same circuit: the
+    Miller loop lines of X_2 and of the G2 generator, and fixed-base tables
+    for the G1 generator and the key's own G1 points. verify_proof and
+    verify_batch use these; verify_proof_unoptimized does not. Make one with
+    VerificationKey.prepare()"""
+
+    X_2_prepared: PreparedG2Point = field(init=False, repr=False)
+    G2_prepared: PreparedG2Point = field(init=False, repr=False)
+    # (x, y) of each point with a table -> its table from fixed_base_tables
+    g1_tables: dict[tuple[int, int], list] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.X_2_prepared = prepare_g2(self.X_2)
+        self.G2_prepared = prepare_g2(b.G2)
+        points = [
+            pt
+            for pt in (
+                b.G1,
+                self.Qm,
+                self.Ql,
+                self.Qr,
+                self.Qo,
+                self.Qc,
+                self.S1,
+                self.S2,
+                self.S3,
+            )
+            if pt is not None
+        ]
+        self.g1_tables = {
+            (int(pt[0]), int(pt[1])): table
+            for pt, table in zip(
+                points, fixed_base_tables(points, PREPARED_WINDOW_BITS)
+            )
+        }
+
+    def pairing_g2_points(self):
+        return self.X_2_prepared, self.G2_prepared
+
+    # Terms on points with a fixed-base table are computed from the tables,
+    # without doublings; the rest (the proof's points) go through ec_lincomb
+    def lincomb(self, terms: list[tuple[G1Point, int]]) -> G1Point:
+        tables, coeffs, rest = [], [], []
+        for pt, coeff in _merge_terms(terms):
+            table = None if pt is None else self.g1_tables.get((int(pt[0]), int(pt[1])))
+            if table is None:
+                rest.append((pt, coeff))
+            else:
+                tables.append(table)
+                coeffs.append(coeff)
+        if tables:
+            rest.append((fixed_base_lincomb(tables, coeffs, PREPARED_WINDOW_BITS), 1))
+        return ec_lincomb(rest)
+
+
+# Sums up the coefficients of terms on the same point
+def _merge_terms(terms: list[tuple[G1Point, int]]) -> list[tuple[G1Point, int]]:
+    merged: dict[Optional[tuple[int, int]], tuple[G1Point, int]] = {}
+    for pt, coeff in terms:
+        key = None if pt is None else (int(pt[0]), int(pt[1]))
+        if key in merged:
+            merged[key] = (pt, merged[key][1] + coeff)
+        else:
+            merged[key] = (pt, coeff)
+    return list(merged.values())